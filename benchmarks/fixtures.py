@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+"""Provides the responses replayed by the benchmarks, so they can run without the FRED API, the U.S. Treasury site or Azure.
+- SERIES: Catalogue of the synthetic FRED timeseries: first date, step in days and number of observations at scale 1.
+- FIXTURES: Class used to build synthetic responses in the FRED and U.S. Treasury XML formats, and to load or record real responses.
+"""
+import os # locates the recorded responses.
+import numpy as np # generates the synthetic timeseries.
+import pandas as pd # generates the synthetic dates.
+import requests # records real responses.
+
+__author__ = "Alejandro Sánchez Gómez"
+__copyright__ = "Copyright 2024, Recession Dashboard"
+__license__ = "MIT license"
+__version__ = "1.0.0"
+__maintainer__ = "Alejandro Sánchez Gómez"
+__email__ = "alejandro@recession-dashboard.com"
+__status__ = "Production"
+
+SERIES = { # id: (months between observations, observations at scale 1), matching the real FRED timeseries.
+    "USREC": (1, 2063),
+    "PCE": (1, 813),
+    "CP": (3, 318),
+    "GDP": (3, 318),
+    "INDPRO": (1, 1293),
+    "MRTSSM44000USS": (1, 417),
+    "UNRATE": (1, 945),
+    "VIXCLS": (0.046, 9600) # about one observation every 1.4 days.
+}
+MONTH_DAYS = 30.44 # days between two monthly observations at scale 1.
+TREASURY_ID = "daily_treasury_yield_curve" # id of the U.S.Treasury timeseries.
+TREASURY_YEARS = range(1990, 2027) # years of the U.S.Treasury pages.
+TREASURY_ROWS = 250 # entries of each U.S.Treasury page at scale 1.
+TREASURY_TENORS = ["BC_1MONTH", "BC_3MONTH", "BC_6MONTH", "BC_1YEAR", "BC_2YEAR", "BC_5YEAR", "BC_10YEAR", "BC_30YEAR"] # labels of each entry.
+TREASURY_MAX_SCALE = 10 # largest scale of the U.S.Treasury pages, which are about 65 MB in total at 10×.
+START_DATE = pd.Timestamp("1990-01-01") # first date used to calculate the recession risk (NRR_VALUE.start_date).
+END_DATE = pd.Timestamp("2026-10-01") # last date of the timeseries at scale 1.
+FIRST_DATE = pd.Timestamp("1678-01-01") # first date representable by pandas, which limits the largest scales.
+LAST_DATE = pd.Timestamp("2262-01-01") # last date representable by pandas.
+RECORDED_DIR = os.path.join(os.path.dirname(__file__), "fixtures") # directory of the recorded responses.
+
+class FIXTURES:
+    """Class used to build synthetic responses in the FRED and U.S. Treasury XML formats, and to load or record real responses.
+    At scale s, monthly and quarterly timeseries have one observation every 30.44/s days (never less than a day), on dates shared by all of them,
+    so they can be unified as the real ones. The dates from START_DATE onwards are s times more, and the history before them is kept within the
+    dates representable by pandas, so the longest timeseries are shorter than s times at 100×. Each U.S.Treasury page has s times its entries,
+    up to TREASURY_MAX_SCALE.
+    """
+    def get_end_date(scale=1):
+        """Returns the last date of the timeseries at the given scale, moved forward when the dates from START_DATE onwards do not fit before END_DATE."""
+        step = max(MONTH_DAYS / scale, 1.0) # days between two monthly observations.
+        rows = int(np.ceil((END_DATE - START_DATE).days / MONTH_DAYS) + 1) * scale # monthly observations from START_DATE onwards.
+        return min(max(END_DATE, START_DATE + pd.Timedelta(days=round((rows - 1) * step))), LAST_DATE)
+
+    def get_series(id, scale=1, seed=0):
+        """Returns a synthetic FRED timeseries as a pandas dataframe with the columns "date" and "id"."""
+        months, rows = SERIES[id]
+        end = FIXTURES.get_end_date(scale)
+        if months >= 1: # multiples of the monthly step, so the dates match the ones of the monthly timeseries.
+            offsets = np.arange(rows * scale) * months * max(MONTH_DAYS / scale, 1.0)
+        else:
+            offsets = np.arange(rows * scale) * max(months * MONTH_DAYS / scale, 1.0)
+        offsets = np.round(offsets[offsets <= (end - FIRST_DATE).days]).astype("int64")[::-1] # days before the last date, limited by FIRST_DATE.
+        dates = pd.DatetimeIndex(end - pd.to_timedelta(offsets, unit="D"))
+
+        rng = np.random.default_rng(seed + sum(map(ord, id)))
+        if id == "USREC": # recessions of about 12 months every 8 years.
+            values = ((dates - FIRST_DATE).days // 365 % 8 == 0).astype(float)
+        else:
+            values = np.round(100 + np.cumsum(rng.normal(size=len(dates))), 3)
+            values[rng.random(len(dates)) < 0.01] = np.nan # FRED writes missing values as ".".
+        return pd.DataFrame({"date": dates, id: values})
+
+    def get_fred_xml(id, scale=1, observation_start=None):
+        """Returns the synthetic response of the FRED API for a timeseries, as bytes."""
+        recorded = FIXTURES.get_recorded(f"{id}.xml") if scale == 1 else None
+        if recorded is not None: return recorded
+
+        df = FIXTURES.get_series(id, scale)
+        if observation_start: df = df[df["date"] >= pd.Timestamp(observation_start)]
+        rows = "".join(f'<observation realtime_start="2026-10-18" realtime_end="2026-10-18" date="{date}" value="{"." if np.isnan(value) else value}"/>'
+                       for date, value in zip(df["date"].dt.strftime("%Y-%m-%d"), df[id]))
+        return (f'<?xml version="1.0" encoding="utf-8" ?><observations realtime_start="2026-10-18" realtime_end="2026-10-18" observation_start="1600-01-01" '
+                f'observation_end="9999-12-31" units="lin" output_type="1" file_type="xml" order_by="observation_date" sort_order="asc" count="{len(df)}" offset="0" limit="100000">'
+                f'{rows}</observations>').encode()
+
+    def get_treasury_xml(year, scale=1, seed=0):
+        """Returns the synthetic response of the U.S.Treasury site for a year, as bytes."""
+        recorded = FIXTURES.get_recorded(f"{TREASURY_ID}_{year}.xml") if scale == 1 else None
+        if recorded is not None: return recorded
+
+        rows = TREASURY_ROWS * min(scale, TREASURY_MAX_SCALE)
+        dates = pd.Timestamp(f"{year}-01-02") + pd.to_timedelta(np.arange(rows) * 360 // rows, unit="D") # dates repeat within the year at large scales.
+        rng = np.random.default_rng(seed + year)
+        values = np.round(np.abs(3 + np.cumsum(rng.normal(scale=0.05, size=(rows, len(TREASURY_TENORS))), axis=0)), 2)
+        entries = []
+        for n, date in enumerate(dates.strftime("%Y-%m-%dT00:00:00")):
+            fields = "".join(f'<d:{tenor} m:type="Edm.Double">{value}</d:{tenor}>' for tenor, value in zip(TREASURY_TENORS, values[n]))
+            entries.append(f'<entry><id>https://home.treasury.gov/Entry({n})</id><title type="text"></title><updated>2026-10-18T00:00:00Z</updated>'
+                           f'<content type="application/xml"><m:properties><d:Id m:type="Edm.Int32">{n}</d:Id>'
+                           f'<d:NEW_DATE m:type="Edm.DateTime">{date}</d:NEW_DATE>{fields}</m:properties></content></entry>')
+        return ('<?xml version="1.0" encoding="utf-8" standalone="yes"?><feed xml:base="https://home.treasury.gov/" xmlns="http://www.w3.org/2005/Atom" '
+                'xmlns:d="http://schemas.microsoft.com/ado/2007/08/dataservices" xmlns:m="http://schemas.microsoft.com/ado/2007/08/dataservices/metadata">'
+                f'<title type="text">DailyTreasuryYieldCurveRateData</title>{"".join(entries)}</feed>').encode()
+
+    def get_recorded(name):
+        """Returns the bytes of a recorded response, or None if it has not been recorded."""
+        path = os.path.join(RECORDED_DIR, name)
+        if not os.path.exists(path): return None
+        with open(path, "rb") as file:
+            return file.read()
+
+    def record():
+        """Records the real responses of the FRED API and the U.S.Treasury site into RECORDED_DIR, so the benchmarks replay them at scale 1.
+        Requires the FRED_API_KEY environmental variable.
+        """
+        os.makedirs(RECORDED_DIR, exist_ok=True)
+        api_key = os.environ["FRED_API_KEY"]
+        urls = [(f"{id}.xml", f"https://api.stlouisfed.org/fred/series/observations?series_id={id}&api_key={api_key}") for id in SERIES]
+        urls += [(f"{TREASURY_ID}_{year}.xml", f"https://home.treasury.gov/resource-center/data-chart-center/interest-rates/pages/xml?data={TREASURY_ID}&field_tdr_date_value={year}")
+                 for year in TREASURY_YEARS]
+        with requests.Session() as session:
+            for name, url in urls:
+                response = session.get(url, timeout=60)
+                response.raise_for_status()
+                with open(os.path.join(RECORDED_DIR, name), "wb") as file:
+                    file.write(response.content)
+                print(f"Recorded {name}")
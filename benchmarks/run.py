@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+"""Runs the offline benchmarks of the system and stores their results, so they can be compared across commits.
+The FRED API and the U.S. Treasury site are replaced by the local server of the server module, Azure Blob Storage by the NRR_STORAGE_DIR
+local directory, and the local store by a temporary directory, so no key nor network connection is needed.
+- BENCHMARK: Class used to run each benchmark at each scale and to store, load and compare the results.
+
+Usage:
+    python benchmarks/run.py [--scales 1 10 100] [--repeat 5] [--memory] [--only get_model_data calculate_nrr]
+    python benchmarks/run.py --compare benchmarks/results/A.json benchmarks/results/B.json
+"""
+import os # creates the temporary directories and the results directory.
+import io # discards the progress printed by the system.
+import sys # locates the modules of the system.
+import json # stores the results.
+import time # measures how long each benchmark takes.
+import runpy # runs main.py end to end.
+import shutil # removes the temporary directories.
+import argparse # reads the command line options.
+import platform # describes the machine of the results.
+import statistics # summarizes the repeated measures.
+import subprocess # reads the current commit.
+import tempfile # creates the temporary directories.
+import tracemalloc # measures the peak memory allocated by Python, if enabled.
+from datetime import datetime # names the results file and the years of the U.S.Treasury pages.
+from contextlib import redirect_stdout # discards the progress printed by the system.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # root directory of the repository.
+sys.path.insert(0, os.path.join(ROOT, "src")) # the system modules are imported as "etl", as main.py does.
+
+import numpy # describes the environment of the results.
+import pandas # describes the environment of the results.
+from etl import api, kpi, metrics, nrr, registry, storage, store # modules of the system that are measured.
+from fixtures import SERIES, TREASURY_ID, FIXTURES # builds the responses.
+from server import FIXTURE_SERVER # serves the responses.
+
+__author__ = "Alejandro Sánchez Gómez"
+__copyright__ = "Copyright 2024, Recession Dashboard"
+__license__ = "MIT license"
+__version__ = "1.0.0"
+__maintainer__ = "Alejandro Sánchez Gómez"
+__email__ = "alejandro@recession-dashboard.com"
+__status__ = "Production"
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results") # directory where the results are stored.
+MAIN = os.path.join(ROOT, "src", "main.py") # program run end to end.
+
+class BENCHMARK:
+    """Class used to run each benchmark at each scale and to store, load and compare the results.
+    Each benchmark is a pair of methods: "setup_<name>" prepares its inputs, which is not measured, and "run_<name>" is measured.
+    Each benchmark only calls public methods whose work is the same across commits, so results of different commits measure the same work.
+    """
+    names = ["stlouis_transform_data", "ustreasury_transform_data", "list_unify", "get_model_data", "calculate_nrr", "run"] # benchmarks in the order they are run.
+
+    def __init__(self, scale, server, workdir):
+        """Initializes the benchmarks of a scale.
+        scale: Scale of the synthetic history.
+        server: FIXTURE_SERVER serving the responses of the scale.
+        workdir: Temporary directory where the local store and blobs are created.
+        """
+        self.scale = scale
+        self.server = server
+        self.workdir = workdir
+        self.years = range(1990, datetime.now().year + 1) # years requested by USTREASURY.request_data.
+
+    def reset_environment(self):
+        """Points the local store and blobs to new temporary directories, so each run starts without stored data."""
+        directory = tempfile.mkdtemp(prefix=f"{self.scale}x-", dir=self.workdir) # new directory on every run.
+        store.CACHE_DIR = os.path.join(directory, "cache")
+        os.environ["NRR_STORAGE_DIR"] = os.path.join(directory, "blobs")
+        storage.STORAGE.client = None # the shared client is created again on the new directory.
+
+    def get_kpis(self):
+        """Returns the KPIs of the catalogue as extracted by the system from the local server, with the target KPI first. They are extracted once per scale."""
+        if not hasattr(self, "kpis"):
+            self.reset_environment()
+            items = []
+            with redirect_stdout(io.StringIO()):
+                for entry in registry.KPI_REGISTRY.get_entries():
+                    item = kpi.KPI(entry["name"])
+                    item.set_data(registry.KPI_REGISTRY.get_api_class(entry), entry["series_id"])
+                    items.append(item.get_data())
+            self.kpis = items
+        return self.kpis
+
+    def get_nrr_value(self):
+        """Returns an NRR_VALUE with copies of the KPIs, without calculating the recession risk."""
+        nrr_value = nrr.NRR_VALUE.__new__(nrr.NRR_VALUE) # skips __init__, which calculates the recession risk.
+        nrr_value.mode = "fit"
+        nrr_value.norm_params = {}
+        nrr_value.set_kpis([elem.copy() for elem in self.get_kpis()])
+        return nrr_value
+
+    # BENCHMARKS
+    def setup_stlouis_transform_data(self):
+        return [(id, FIXTURES.get_fred_xml(id, self.scale)) for id in SERIES]
+
+    def run_stlouis_transform_data(self, data):
+        """Parses the FRED responses of all timeseries. Returns the number of rows."""
+        return sum(len(api.STLOUIS.transform_data(id, content)) for id, content in data)
+
+    def setup_ustreasury_transform_data(self):
+        return [FIXTURES.get_treasury_xml(year, self.scale) for year in self.years]
+
+    def run_ustreasury_transform_data(self, pages):
+        """Parses the U.S.Treasury pages of all years and concatenates them. Returns the number of rows."""
+        chunks = [api.parse_ustreasury_page(content, api.USTREASURY.tenors) for content in pages] # the pages are parsed inside request_data.
+        return len(api.USTREASURY.transform_data(TREASURY_ID, chunks))
+
+    def setup_list_unify(self):
+        return self.get_nrr_value()
+
+    def run_list_unify(self, nrr_value):
+        """Unifies the KPIs, without normalizing them. Returns the number of rows."""
+        return len(nrr_value.list_unify())
+
+    def setup_get_model_data(self):
+        return self.get_nrr_value()
+
+    def run_get_model_data(self, nrr_value):
+        """Normalizes and unifies the KPIs, and fills the empty cells, as done before fitting the model. Returns the number of rows."""
+        return len(nrr_value.get_model_data()[1])
+
+    def setup_calculate_nrr(self):
+        self.reset_environment() # the fitted models are stored in the local store.
+        return self.get_nrr_value()
+
+    def run_calculate_nrr(self, nrr_value):
+        """Normalizes and unifies the KPIs, fits the model and predicts the recession risk. Returns the number of rows."""
+        nrr_value.calculate_nrr()
+        return len(nrr_value.get_nrr_table())
+
+    def setup_run(self):
+        self.reset_environment()
+        return None
+
+    def run_run(self, _):
+        """Runs main.py end to end: extraction from the local server, recession risk and upload into the local blobs."""
+        saved_argv = sys.argv
+        sys.argv = [MAIN] # all enabled KPIs are refreshed.
+        try:
+            runpy.run_path(MAIN) # main.py runs the system when it is executed.
+        finally:
+            sys.argv = saved_argv
+        return None
+
+    def measure(self, name, repeat, memory=False):
+        """Runs a benchmark several times and summarizes its measures.
+        name: Name of the benchmark.
+        repeat: Number of measured runs.
+        memory: If True, an additional run measures the peak memory allocated by Python with tracemalloc.
+        Returns a dictionary with the seconds of each run, their minimum and median, and the rows produced.
+        """
+        setup, run = getattr(self, "setup_" + name), getattr(self, "run_" + name)
+        seconds = []
+        rows = None
+        with redirect_stdout(io.StringIO()): # the progress printed by the system is not measured.
+            for _ in range(repeat):
+                data = setup()
+                start = time.perf_counter()
+                rows = run(data)
+                seconds.append(time.perf_counter() - start)
+            peak = None
+            if memory: # measured apart, as tracemalloc slows the run down.
+                data = setup()
+                tracemalloc.start()
+                metrics.METRICS.python_peak = None
+                run(data)
+                peak = metrics.METRICS.get_python_peak() # the stages reset the tracemalloc peak, but keep the peak of the run.
+                tracemalloc.stop()
+        return {"seconds": seconds, "min": min(seconds), "median": statistics.median(seconds), "rows": rows, "peak_python_bytes": peak}
+
+    # RESULTS
+    def get_commit():
+        """Returns the current commit and whether the working tree has uncommitted changes, or ("unknown", False) outside a git repository."""
+        try:
+            commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+            dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip())
+            return commit, dirty
+        except (OSError, subprocess.CalledProcessError):
+            return "unknown", False
+
+    def run_all(scales, repeat, memory=False, only=None):
+        """Runs the benchmarks at each scale.
+        scales: List of scales of the synthetic history.
+        repeat: Number of measured runs of each benchmark.
+        memory: If True, the peak memory allocated by Python is also measured.
+        only: Optional list of names of the benchmarks to run. If not given, all of them are run.
+        Returns the results as a dictionary.
+        """
+        commit, dirty = BENCHMARK.get_commit()
+        results = {"commit": commit, "dirty": dirty, "timestamp": datetime.now().isoformat(timespec="seconds"), "repeat": repeat,
+                   "python": platform.python_version(), "numpy": numpy.__version__, "pandas": pandas.__version__,
+                   "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cores)", "benchmarks": {}}
+        saved = (api.STLOUIS.url, api.USTREASURY.url, store.CACHE_DIR, os.environ.get("NRR_STORAGE_DIR"), os.environ.get("FRED_API_KEY"))
+        os.environ.setdefault("FRED_API_KEY", "benchmark") # the local server does not check the key.
+        workdir = tempfile.mkdtemp(prefix="nrr-benchmark-")
+        try:
+            for scale in scales:
+                with FIXTURE_SERVER(scale) as server:
+                    api.STLOUIS.url, api.USTREASURY.url = server.get_fred_url(), server.get_treasury_url()
+                    benchmark = BENCHMARK(scale, server, workdir)
+                    server.warm_up(SERIES, TREASURY_ID, benchmark.years)
+                    for name in BENCHMARK.names:
+                        if only and name not in only: continue
+                        item = benchmark.measure(name, repeat, memory)
+                        results["benchmarks"].setdefault(name, {})[str(scale)] = item
+                        print(f"{name:<28}{scale:>5}x  median {item['median']:9.4f}s  min {item['min']:9.4f}s  rows {item['rows'] if item['rows'] is not None else '-'}")
+        finally:
+            api.STLOUIS.url, api.USTREASURY.url, store.CACHE_DIR = saved[:3]
+            for key, value in zip(["NRR_STORAGE_DIR", "FRED_API_KEY"], saved[3:]):
+                if value is None: os.environ.pop(key, None)
+                else: os.environ[key] = value
+            storage.STORAGE.client = None
+            shutil.rmtree(workdir, ignore_errors=True)
+        return results
+
+    def save(results, directory=None):
+        """Stores the results as a JSON file named after their date and commit.
+        Returns the path of the file.
+        """
+        directory = directory or RESULTS_DIR
+        os.makedirs(directory, exist_ok=True)
+        name = f"{results['timestamp'].replace(':', '').replace('-', '')}_{results['commit']}{'-dirty' if results['dirty'] else ''}.json"
+        path = os.path.join(directory, name)
+        with open(path, "w") as file:
+            json.dump(results, file, indent=1)
+        return path
+
+    def load(path):
+        """Returns the results stored in a JSON file."""
+        with open(path) as file:
+            return json.load(file)
+
+    def compare(old, new):
+        """Returns a text table comparing the median seconds of two results, benchmark by benchmark and scale by scale."""
+        lines = [f"{'benchmark':<28}{'scale':>6}{old['commit']:>14}{new['commit']:>14}{'change':>10}"]
+        for name in BENCHMARK.names:
+            for scale in sorted(set(old["benchmarks"].get(name, {})) | set(new["benchmarks"].get(name, {})), key=int):
+                before = old["benchmarks"].get(name, {}).get(scale, {}).get("median")
+                after = new["benchmarks"].get(name, {}).get(scale, {}).get("median")
+                change = f"{(after / before - 1) * 100:+9.1f}%" if before and after else f"{'-':>10}"
+                lines.append(f"{name:<28}{scale + 'x':>6}{before if before is not None else float('nan'):>14.4f}{after if after is not None else float('nan'):>14.4f}{change}")
+        return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the offline benchmarks of the system.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="scales of the synthetic history.")
+    parser.add_argument("--repeat", type=int, default=5, help="number of measured runs of each benchmark.")
+    parser.add_argument("--memory", action="store_true", help="also measures the peak memory allocated by Python.")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARK.names, help="names of the benchmarks to run.")
+    parser.add_argument("--output", help="directory where the results are stored. Defaults to benchmarks/results.")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compares two stored results instead of running the benchmarks.")
+    args = parser.parse_args()
+
+    if args.compare:
+        print(BENCHMARK.compare(BENCHMARK.load(args.compare[0]), BENCHMARK.load(args.compare[1])))
+    else:
+        results = BENCHMARK.run_all(args.scales, args.repeat, args.memory, args.only)
+        print(f"Results stored in {BENCHMARK.save(results, args.output)}")
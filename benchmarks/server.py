@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+"""Provides a local HTTP stand-in for the FRED API and the U.S. Treasury site, which replays the responses of the fixtures module.
+- HANDLER: Class used to answer the requests of FIXTURE_SERVER with the responses of the fixtures module.
+- FIXTURE_SERVER: Class used to serve the responses of a given scale from a background thread.
+"""
+import threading # serves the responses from a background thread.
+from urllib.parse import urlparse, parse_qs # reads the path and parameters of the requests.
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler # serves several requests at the same time, as USTREASURY does.
+from fixtures import FIXTURES # builds the responses.
+
+__author__ = "Alejandro Sánchez Gómez"
+__copyright__ = "Copyright 2024, Recession Dashboard"
+__license__ = "MIT license"
+__version__ = "1.0.0"
+__maintainer__ = "Alejandro Sánchez Gómez"
+__email__ = "alejandro@recession-dashboard.com"
+__status__ = "Production"
+
+FRED_PATH = "/fred/series/observations" # path of the FRED API.
+TREASURY_PATH = "/treasury/xml" # path of the U.S.Treasury site.
+
+class HANDLER(BaseHTTPRequestHandler):
+    """Class used to answer the requests of FIXTURE_SERVER with the responses of the fixtures module. Responses are built once per scale and kept in memory, so building them is not measured."""
+    protocol_version = "HTTP/1.1" # keeps the connections open between requests, as the real sites do.
+    scale = 1 # scale of the served responses.
+    responses = {} # built responses by (path, id, year or observation_start).
+    lock = threading.Lock() # builds each response only once.
+
+    def get_response(key):
+        """Returns the response of a request, building it the first time it is requested."""
+        with HANDLER.lock:
+            if key not in HANDLER.responses:
+                path, id, param = key
+                if path == FRED_PATH:
+                    HANDLER.responses[key] = FIXTURES.get_fred_xml(id, HANDLER.scale, param)
+                else:
+                    HANDLER.responses[key] = FIXTURES.get_treasury_xml(int(param), HANDLER.scale)
+            return HANDLER.responses[key]
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        try:
+            if url.path == FRED_PATH:
+                content = HANDLER.get_response((FRED_PATH, query["series_id"], query.get("observation_start")))
+            elif url.path == TREASURY_PATH:
+                content = HANDLER.get_response((TREASURY_PATH, query["data"], query["field_tdr_date_value"]))
+            else:
+                raise KeyError(url.path)
+        except (KeyError, ValueError):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass # the requests are not printed.
+
+class FIXTURE_SERVER:
+    """Class used to serve the responses of a given scale from a background thread. It is used with a "with" statement."""
+    def __init__(self, scale=1):
+        """Initializes the server.
+        scale: Scale of the served responses.
+        """
+        self.scale = scale
+
+    def __enter__(self):
+        HANDLER.scale = self.scale
+        HANDLER.responses = {}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), HANDLER) # listens on a free port.
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        return False # exceptions are not swallowed.
+
+    def get_fred_url(self):
+        """Returns the URL to use as STLOUIS.url."""
+        return f"http://127.0.0.1:{self.server.server_port}{FRED_PATH}"
+
+    def get_treasury_url(self):
+        """Returns the URL to use as USTREASURY.url."""
+        return f"http://127.0.0.1:{self.server.server_port}{TREASURY_PATH}"
+
+    def warm_up(self, fred_ids, treasury_id, years):
+        """Builds the complete responses in advance, so the first measured run does not include building them."""
+        for id in fred_ids: HANDLER.get_response((FRED_PATH, id, None))
+        for year in years: HANDLER.get_response((TREASURY_PATH, treasury_id, str(year)))
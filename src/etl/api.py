@@ -8,13 +8,20 @@
 - USTREASURY: Implementation of the API class that extracts data from the U.S. Treasury repository.
 """
 import os # access Window's system environmental variables in order to authentificate to Azure Blob Storage.
-import requests # makes HTTP requests to extract data from web repositories.
+import requests # catches the errors of the HTTP requests.
 import pandas as pd # transforms extracted data into workable formats.
+import io # reads the HTTP's requests data as a stream of in-memory bytes.
+import numpy as np # stores parsed data into preallocated arrays.
 from bs4 import BeautifulSoup # parses XML data from HTTP's requests.
+from lxml import etree # parses XML data from HTTP's requests as a stream.
 from concurrent.futures import ThreadPoolExecutor, as_completed # provides modules for making parallel HTTP requests.
 from abc import ABC, abstractmethod # enables the use Oriented Object Programming to Python by providing tools to create interfaces and abstract classes.
 from enum import Enum # enables the use Oriented Object Programming to Python by providing tools to create enum classes.
 from datetime import datetime # extracts current datetime.
+import time # checks how old the stored pages are.
+from etl import store # stores the extracted data locally, so only new observations have to be extracted.
+from etl import metrics # measures the time, bytes and rows of each stage.
+from etl import transport # sends the HTTP requests through a shared pooled session, with retries and rate limits.
 
 __author__ = "Alejandro Sánchez Gómez"
 __copyright__ = "Copyright 2024, Recession Dashboard"
@@ -65,135 +72,315 @@ class API(ABC):
         """
         pass # requires implementation.
 
+def parse_stlouis_bs4(id, content):
+    """External method created to assist the method transform_data from the STLOUIS class. Parses the complete XML data tree with BeautifulSoup.
+    id: Name of the timeseries data that we have just extracted.
+    content: Bytes of the XML data extracted from the FRED repository.
+    Returns a pandas dataframe.
+    """
+    data = BeautifulSoup(content, "lxml-xml") # parses the HTTP request data into XML.
+    cols = ["date", id] # future columns of the pandas dataframe that has to be returned.
+    rows = [] # future rows of the pandas dataframe that has to be returned.
+
+    for elem in data.find_all("observation"): # iterates through the XML tree and extracts the data under the "observation" label.
+        rows.append({  # appends the extracted data to rows of the future pandas dataframe.
+            "date": elem.get("date"),
+            id: elem.get("value")
+        }) 
+        
+    df = pd.DataFrame(rows, columns=cols) # creates the pandas dataframe from the extracted data.
+    df["date"] = pd.to_datetime(df["date"]) # converts the datatype of the "date" column to datetime.
+    df[id] = pd.to_numeric(df[id], errors = 'coerce') # converts the column "id" to numeric.
+
+    return df
+
+def parse_stlouis_lxml(id, content):
+    """External method created to assist the method transform_data from the STLOUIS class. Parses the XML data as a stream,
+    writing each observation straight into preallocated date and value arrays and clearing it as soon as it is read.
+    id: Name of the timeseries data that we have just extracted.
+    content: Bytes of the XML data extracted from the FRED repository.
+    Returns a pandas dataframe.
+    """
+    dates = np.empty(0, dtype="datetime64[D]") # future "date" column of the pandas dataframe that has to be returned.
+    values = np.empty(0, dtype=np.float64) # future "id" column of the pandas dataframe that has to be returned.
+    n = 0 # number of observations read.
+
+    for event, elem in etree.iterparse(io.BytesIO(content), events=("start", "end"), tag=("observations", "observation")):
+        if event == "start":
+            if elem.tag == "observations": # the root label tells how many observations there are, so the arrays are allocated once.
+                count = int(elem.get("count") or 0)
+                dates, values = np.empty(count, dtype="datetime64[D]"), np.empty(count, dtype=np.float64)
+            continue
+        if elem.tag != "observation": continue
+
+        if n == len(dates): # grows the arrays if the root label did not tell the right number of observations.
+            dates, values = np.resize(dates, 2 * n + 1), np.resize(values, 2 * n + 1)
+        dates[n] = elem.get("date")
+        try: # missing values are written as "." by FRED.
+            values[n] = float(elem.get("value"))
+        except (TypeError, ValueError):
+            values[n] = np.nan
+        n = n + 1
+
+        elem.clear() # frees the observation once it is read.
+        while elem.getprevious() is not None: del elem.getparent()[0] # frees the observations already read.
+
+    return pd.DataFrame({"date": dates[:n].astype("datetime64[ns]"), id: values[:n]})
+
 class STLOUIS(API):
     """Implementation of the API class that extracts data from the FRED repository."""
-    def request_data(id):
+    url = os.environ.get("FRED_API_URL", "https://api.stlouisfed.org/fred/series/observations") # endpoint of the FRED API. It can be changed to replay recorded responses.
+    revision_days = 1095 # number of days before the last stored observation that are extracted again, as FRED revises recent observations.
+    parsers = {"lxml": parse_stlouis_lxml, "bs4": parse_stlouis_bs4} # catalogue of the coded XML parsers.
+    parser = os.environ.get("FRED_PARSER", "lxml") # XML parser used by transform_data. The "bs4" parser is kept for comparison.
+
+    def request_data(id, observation_start=None):
         """Implementation of request_data for the FRED repository. 
-        Returns XML data tree.
+        observation_start: Optional "YYYY-MM-DD" date. If given, only observations from that date onwards are requested.
+        Returns the XML data as bytes.
         """
         api_key = os.environ.get("FRED_API_KEY") # key needed in order to use the FRED API.
-        url = "https://api.stlouisfed.org/fred/series/observations?series_id=" + id + "&api_key=" + api_key # URL to get access to the FRED API.
+        url = STLOUIS.url + "?series_id=" + id + "&api_key=" + api_key # URL to get access to the FRED API.
+        if observation_start: url = url + "&observation_start=" + observation_start # requests only the observations that could have changed.
         try: # requests data from the FRED API. If it's not able to do it, raises a RequestException.
-            response = requests.get(url) # requests data from the FRED API.
+            response = transport.TRANSPORT.get(url) # requests data from the FRED API, retrying transient failures.
             response.raise_for_status() # raises the status of the HTTP request.
-            data = BeautifulSoup(response.content, "lxml-xml") # parses the HTTP request data into XML.
             print(f"Database {id} successfully fetched!")
-            return data
+            return response.content
         except requests.exceptions.RequestException as e:
             print(f"ERROR fetching {id}: {e}")
             return None
         
-    def transform_data(id, data):
+    def transform_data(id, data, parser=None):
         """Implementation of transform_data for the FRED repository. 
+        parser: Optional name of the XML parser from STLOUIS.parsers. If not given, STLOUIS.parser is used.
         Returns a pandas dataframe.
         """
-        cols = ["date", id] # future columns of the pandas dataframe that has to be returned.
-        rows = [] # future rows of the pandas dataframe that has to be returned.
-
-        for elem in data.find_all("observation"): # iterates through the XML tree and extracts the data under the "observation" label.
-            rows.append({  # appends the extracted data to rows of the future pandas dataframe.
-                "date": elem.get("date"),
-                id: elem.get("value")
-            }) 
-            
-        df = pd.DataFrame(rows, columns=cols) # creates the pandas dataframe from the extracted data.
-        df["date"] = pd.to_datetime(df["date"]) # converts the datatype of the "date" column to datetime.
-        df[id] = pd.to_numeric(df[id], errors = 'coerce') # converts the column "id" to numeric.
-        if(id == "USREC"): df = df.iloc[769:] # removes unnecessary rows from USREC dataframe.
-
-        return df
+        return STLOUIS.parsers[parser or STLOUIS.parser](id, data)
     
     def get_data(id):
-        """Implementation of get_data for the FRED repository. 
+        """Implementation of get_data for the FRED repository. Only the observations after the last stored date (minus the revision window) are requested,
+        then they are merged into the local series store, which holds the complete timeseries.
         Returns a pandas dataframe.
         """
-        data = STLOUIS.request_data(id) 
-        df = STLOUIS.transform_data(id, data)
+        last_date = store.SERIES_STORE.get_last_date(id) # last stored date of the timeseries, None if it has never been extracted.
+        observation_start = None # the complete timeseries is requested if it has never been extracted.
+        if last_date is not None:
+            observation_start = (pd.Timestamp(last_date) - pd.Timedelta(days=STLOUIS.revision_days)).strftime("%Y-%m-%d")
+
+        with metrics.METRICS.stage("fetch", id) as stage:
+            data = STLOUIS.request_data(id, observation_start)
+            stage.add(bytes=len(data) if data else 0)
+        if data is not None: # if the request failed, the stored timeseries is used.
+            with metrics.METRICS.stage("parse", id) as stage:
+                df_new = STLOUIS.transform_data(id, data)
+                stage.add(rows=len(df_new))
+            store.SERIES_STORE.set_series(id, df_new) # merges the new and revised observations into the stored timeseries.
+
+        with metrics.METRICS.stage("transform", id) as stage:
+            df = store.SERIES_STORE.get_series(id) # complete timeseries.
+            if(id == "USREC"): df = df.iloc[769:] # removes unnecessary rows from USREC dataframe.
+            stage.add(rows=len(df))
 
         return df
   
-def fetch_ustreasury(url, year):
-    """External method created to assist the method transform_data from the USTREASURY class. 
+def fetch_ustreasury(id, url, year):
+    """External method created to assist the method request_data from the USTREASURY class. 
+    Closed years already stored are never requested again. The current year is reused while it is newer than USTREASURY.ttl,
+    and then revalidated with its ETag/Last-Modified headers, so it is only downloaded again if it has changed.
+    Downloaded pages are not stored here, as they are only stored once extract_ustreasury has parsed them.
+    id: Name of the timeseries data.
     url: URL to get access to the U.S.Treasury API.
     year: Year of the Trasury Yield Rate data that we want to extract. 
-    Returns XML data tree. 
+    Returns the year, the XML data (None if it could not be extracted) and the headers of the response if it was downloaded from the network (None if it came from the local store).
     """
+    page = store.PAGE_STORE.get_page(id, year) # page stored on a previous run, None if it has never been extracted.
+    if page is not None:
+        closed = page["fetched_at"] >= datetime(year + 1, 1, 1).timestamp() + USTREASURY.closing_days * 86400 # the page was extracted after its year was over.
+        fresh = time.time() - page["fetched_at"] < USTREASURY.ttl # the page was extracted recently.
+        if closed or fresh: return year, page["content"], None
+
+    headers = {} # conditional request headers, so the page is only sent if it has changed.
+    if page is not None and page["etag"]: headers["If-None-Match"] = page["etag"]
+    if page is not None and page["last_modified"]: headers["If-Modified-Since"] = page["last_modified"]
+
     try: # requests data from the U.S.Treasury API. If it's not able to do it, raises a RequestException.
-        response = requests.get(url) # requests data from the U.S.Treasury API.
+        response = transport.TRANSPORT.get(url, headers=headers) # requests data from the U.S.Treasury API, retrying transient failures.
+        if response.status_code == 304 and page is not None: # the stored page has not changed.
+            store.PAGE_STORE.touch_page(id, year)
+            return year, page["content"], None
         response.raise_for_status() # raises the status of the HTTP request.
-        return year, response.content
+        return year, response.content, response.headers
     except requests.exceptions.RequestException as e:
         print(f"ERROR fetching {year}: {e}")
-        return year, None
+        if page is not None: return year, page["content"], None # uses the stored page if the request failed.
+        return year, None, None
+
+ATOM_NS = "{http://www.w3.org/2005/Atom}" # namespace of the "content" labels of the U.S.Treasury pages.
+DATA_NS = "{http://schemas.microsoft.com/ado/2007/08/dataservices}" # namespace of the "d:*" labels of the U.S.Treasury pages.
+
+def parse_ustreasury_bs4(pages, tenors):
+    """External method created to assist the method request_data from the USTREASURY class. Appends all pages into a single BeautifulSoup
+    XML data tree, converts the extracted labels to strings and removes the XML tags with regular expressions.
+    pages: List of bytes of the XML data extracted from the U.S.Treasury repository.
+    tenors: List of names of the "d:BC_*" labels to extract.
+    Returns a pandas dataframe.
+    """
+    data = BeautifulSoup(features="lxml-xml") # initializing an empty XML data tree.
+    for content in pages: data.append(BeautifulSoup(content, features="lxml-xml")) # appends each parsed page to the XML data tree.
+
+    cols = ["date"] + [tenor.lower() for tenor in tenors] # future columns of the pandas dataframe that has to be returned.
+    rows = [] # future rows of the pandas dataframe that has to be returned.
+
+    for elem in data.find_all("content"): # iterates through the XML tree and extracts the data under the "content" label.
+        row = {"date": elem.find("d:NEW_DATE")}
+        for tenor in tenors: row[tenor.lower()] = elem.find("d:" + tenor)
+        rows.append(row) # appends the extracted data to rows of the future pandas dataframe.
+    
+    df = pd.DataFrame(rows, columns=cols) # creates the pandas dataframe from the extracted data.
+
+    df = df.astype(str) # converts the entire dataframe to string type in order to transform the rows content to a workable one.
+    for n in df.columns:df[n] = df[n].str.replace('<.*?>', '', regex=True) # using regular expressions, removes all unnecessary chars from the rows.
+    df['date'] = df['date'].str.replace('T00:00:00', '') # removes the string "T00:00:00" from the rows.
+
+    df["date"] = pd.to_datetime(df["date"]) # converts the datatype of the "date" column to datetime.
+    for n in cols[1:]: df[n] = pd.to_numeric(df[n], errors = 'coerce') # converts the tenor columns to numeric.
+
+    return df
+
+def parse_ustreasury_page(content, tenors):
+    """External method created to assist the method request_data from the USTREASURY class. Parses a single page as a stream,
+    reading the text of the "d:NEW_DATE" and "d:BC_*" labels of each entry straight into typed arrays.
+    content: Bytes of the XML data extracted from the U.S.Treasury repository.
+    tenors: List of names of the "d:BC_*" labels to extract.
+    Returns a dictionary with a "date" array and one float array per tenor, named after the tenor in lower case.
+    """
+    columns = {tenor: i for i, tenor in enumerate(tenors)} # position of each tenor in the row.
+    dates = [] # dates of the entries.
+    rows = [] # values of the tenors of the entries.
+
+    for _, elem in etree.iterparse(io.BytesIO(content), events=("end",), tag=ATOM_NS + "content"): # iterates through the "content" label of each entry.
+        date, row = None, [np.nan] * len(tenors)
+        for field in elem.iter(DATA_NS + "*"): # iterates through the "d:*" labels of the entry.
+            name = field.tag[len(DATA_NS):]
+            if name == "NEW_DATE":
+                date = (field.text or "")[:10] # removes the "T00:00:00" time.
+            elif name in columns and field.text:
+                try:
+                    row[columns[name]] = float(field.text)
+                except ValueError:
+                    pass # non numeric values are kept as missing values.
+        dates.append(date or "NaT")
+        rows.append(row)
+
+        elem.clear() # frees the entry once it is read.
+        entry = elem.getparent()
+        while entry is not None and entry.getprevious() is not None: del entry.getparent()[0] # frees the entries already read.
+
+    values = np.array(rows, dtype=np.float64).reshape(len(rows), len(tenors))
+    chunk = {"date": np.array(dates, dtype="datetime64[D]")}
+    for tenor, i in columns.items(): chunk[tenor.lower()] = values[:, i]
+
+    return chunk
+
+def extract_ustreasury(id, url, year, tenors, parser):
+    """External method created to assist the method request_data from the USTREASURY class. Fetches and parses the page of a single year,
+    so it can be done inside the worker threads.
+    id: Name of the timeseries data.
+    url: URL to get access to the U.S.Treasury API.
+    year: Year of the Trasury Yield Rate data that we want to extract.
+    tenors: List of names of the "d:BC_*" labels to extract.
+    parser: Name of the XML parser, "lxml" or "bs4".
+    Pages are only stored once they are parsed and contain at least one entry, so an error page or an empty feed is never kept as a closed year.
+    Stored pages that fail to parse or contain no entries are removed, so they are extracted again on the next run.
+    Returns the year and a dictionary with a "date" array and one float array per tenor, or None if the page could not be fetched.
+    """
+    with metrics.METRICS.stage("fetch", id) as stage:
+        year, content, headers = fetch_ustreasury(id, url, year)
+        if headers is not None: stage.add(bytes=len(content)) # only the pages downloaded from the network are counted as bytes.
+        elif content: stage.add(cache_hits=1)
+    if not content: return year, None
+
+    try: # parses the page. If it is not a valid page, it is removed from the local store.
+        with metrics.METRICS.stage("parse", id) as stage:
+            if parser == "bs4": # converts the dataframe of the legacy parser into arrays.
+                df = parse_ustreasury_bs4([content], tenors)
+                chunk = {n: df[n].to_numpy() for n in df.columns}
+            else:
+                chunk = parse_ustreasury_page(content, tenors)
+            stage.add(rows=len(chunk["date"]))
+    except Exception:
+        if headers is None: store.PAGE_STORE.purge(id, year) # the stored page is not valid.
+        raise
+
+    if headers is not None and len(chunk["date"]) > 0: # stores the downloaded page for the next runs.
+        store.PAGE_STORE.set_page(id, year, content, headers.get("ETag"), headers.get("Last-Modified"))
+    elif headers is None and len(chunk["date"]) == 0: # the stored page has no entries, so it is never kept as a closed year.
+        store.PAGE_STORE.purge(id, year)
+    return year, chunk
 
 class USTREASURY(API):
     """Implementation of the API class that extracts data from the U.S. Treasury repository."""
-    def request_data(id):
-        """Implementation of request_data for the U.S.Treasury repository. In order to maximize efficiency, the HTTP request will be performed through parallelization.
-        Returns XML data tree.
+    url = os.environ.get("USTREASURY_API_URL", "https://home.treasury.gov/resource-center/data-chart-center/interest-rates/pages/xml") # endpoint of the U.S.Treasury API. It can be changed to replay recorded responses.
+    ttl = 6 * 3600 # number of seconds the stored page of the current year is used without revalidating it.
+    closing_days = 7 # number of days after the end of a year after which its page is considered final and is never requested again.
+    tenors = ["BC_3MONTH", "BC_6MONTH", "BC_1YEAR", "BC_10YEAR", "BC_30YEAR"] # names of the "d:BC_*" labels extracted by transform_data.
+    parser = os.environ.get("USTREASURY_PARSER", "lxml") # XML parser used by request_data. The "bs4" parser is kept for comparison.
+    max_workers = int(os.environ.get("USTREASURY_WORKERS", 10)) # maximum number of parallel threads used by request_data.
+
+    def request_data(id, parser=None, tenors=None):
+        """Implementation of request_data for the U.S.Treasury repository. In order to maximize efficiency, each year is fetched and parsed
+        inside a pool of USTREASURY.max_workers threads sharing the pooled HTTP session of the transport module.
+        parser: Optional name of the XML parser, "lxml" or "bs4". If not given, USTREASURY.parser is used.
+        tenors: Optional list of names of the "d:BC_*" labels to extract. If not given, USTREASURY.tenors is used.
+        Years that fail are printed and skipped, and the other years are kept. Raises a ValueError if no year could be extracted,
+        so an empty timeseries is never returned.
+        Returns a list with the parsed arrays of each year, sorted by year.
         """
+        parser = parser or USTREASURY.parser
+        tenors = tenors or USTREASURY.tenors
         last_year = datetime.now().year # gets current year.
         initial_year = 1990 # year when the older Treasury Yield Rate timeseries data is recorded.
         urls = [ # stores all HTTP requests into a single list by year.
-            (f"https://home.treasury.gov/resource-center/data-chart-center/interest-rates/pages/xml?data={id}&field_tdr_date_value={year}", year)
+            (f"{USTREASURY.url}?data={id}&field_tdr_date_value={year}", year)
             for year in range(initial_year, last_year + 1)
         ]
-        data = BeautifulSoup(features="lxml-xml") # initializing an empty XML data tree.
+        chunks = {} # parsed arrays of each year.
         total = len(urls) # total of requests we will need in order to calculate the fetching progress.
         completed = 0 # initializing number of requests completed in order to calculate the fetching progress.
 
-        with ThreadPoolExecutor(max_workers=10) as executor: # start of the request parallelization process with a maximum number of parallel threads of 10.
-            
-            future_to_url = {executor.submit(fetch_ustreasury, url, year): (url, year) for url, year in urls} # collects all HTTP requests done through parallelization.
+        with ThreadPoolExecutor(max_workers=USTREASURY.max_workers) as executor: # start of the parallelization process, reusing the connections between requests.
+            future_to_url = {executor.submit(extract_ustreasury, id, url, year, tenors, parser): (url, year) for url, year in urls} # collects all HTTP requests done through parallelization.
 
-            for future in as_completed(future_to_url): # iterates through the completed HTTP requests in order to parse it into an XML data tree.
+            for future in as_completed(future_to_url): # iterates through the completed HTTP requests.
                 completed += 1 # increases the number of completed requests int order to calculate the fetching progress.
                 url, year = future_to_url[future] # extracts the year of the completed request.
 
                 try: # check if the HTTP request is empty or not. If it's empty, raises a generic Exception.
-                    year, content = future.result() # checks year and content of the HTTP request.
-                    if content:
-                        page = BeautifulSoup(content, features="lxml-xml") # parses the HTTP request into a XML data tree.
-                        data.append(page) # appends the parsed data to previous XML data tree.
+                    year, chunk = future.result() # checks year and parsed arrays of the HTTP request.
+                    if chunk is not None: chunks[year] = chunk # stores the parsed arrays of the year.
                 except Exception as exc:
-                    print(f"Generated an exception for {year}: {exc}")
-                    return None
+                    print(f"Generated an exception for {year}: {exc}") # only this year is skipped.
 
                 print(f"Database {id} fetching progress: {completed}/{total} ({(completed/total)*100:.2f}%)")
         
-        print(f"Database {id} successfully fetched!")
-        return data
+        if not any(len(chunk["date"]) for chunk in chunks.values()): # no year could be extracted.
+            raise ValueError(f"No data of {id} could be extracted from the U.S.Treasury repository.")
+        skipped = total - len(chunks) # years that could not be extracted.
+        if skipped: print(f"Database {id} fetched with {skipped} years skipped.")
+        else: print(f"Database {id} successfully fetched!")
+        return [chunks[year] for year in sorted(chunks)]
 
     
     def transform_data(id, data):
-        """Implementation of transform_data for the U.S.Treasury repository. 
+        """Implementation of transform_data for the U.S.Treasury repository. Concatenates the parsed arrays of all years at once.
+        Raises a ValueError if there are no parsed arrays, so an empty timeseries is never returned.
         Returns a pandas dataframe.
         """
-        cols = ["date", "bc_3month", "bc_6month", "bc_1year", "bc_10year", "bc_30year"]  # future columns of the pandas dataframe that has to be returned.
-        rows = [] # future rows of the pandas dataframe that has to be returned.
-
-        for elem in data.find_all("content"): # iterates through the XML tree and extracts the data under the "content" label.
-            rows.append({ # appends the extracted data to rows of the future pandas dataframe.
-                "date": elem.find("d:NEW_DATE"),
-                "bc_3month": elem.find("d:BC_3MONTH"),
-                "bc_6month": elem.find("d:BC_6MONTH"),
-                "bc_1year": elem.find("d:BC_1YEAR"),
-                "bc_10year": elem.find("d:BC_10YEAR"),
-                "bc_30year": elem.find("d:BC_30YEAR")
-            }) 
-        
-        df = pd.DataFrame(rows, columns=cols) # creates the pandas dataframe from the extracted data.
-
-        df = df.astype(str) # converts the entire dataframe to string type in order to transform the rows content to a workable one.
-        for n in df.columns:df[n] = df[n].str.replace('<.*?>', '', regex=True) # using regular expressions, removes all unnecessary chars from the rows.
-        df['date'] = df['date'].str.replace('T00:00:00', '') # removes the string "T00:00:00" from the rows.
-
-        df["date"] = pd.to_datetime(df["date"]) # converts the datatype of the "date" column to datetime.
-        df["bc_3month"] = pd.to_numeric(df["bc_3month"], errors = 'coerce') # converts the column "bc_3month" to numeric.
-        df["bc_6month"] = pd.to_numeric(df["bc_6month"], errors = 'coerce')
-        df["bc_1year"] = pd.to_numeric(df["bc_1year"], errors = 'coerce')
-        df["bc_10year"] = pd.to_numeric(df["bc_10year"], errors = 'coerce')
-        df["bc_30year"] = pd.to_numeric(df["bc_30year"], errors = 'coerce')
+        if not data: raise ValueError(f"There is no data of {id} to transform.")
+        cols = list(data[0]) # columns of the pandas dataframe that has to be returned.
+        df = pd.DataFrame({n: np.concatenate([chunk[n] for chunk in data]) for n in cols}, columns=cols) # concatenates all years at once.
+        df["date"] = df["date"].astype("datetime64[ns]")
 
         return df
     
@@ -202,6 +389,8 @@ class USTREASURY(API):
         Returns a pandas dataframe.
         """
         data = USTREASURY.request_data(id)
-        df = USTREASURY.transform_data(id, data)
+        with metrics.METRICS.stage("transform", id) as stage:
+            df = USTREASURY.transform_data(id, data)
+            stage.add(rows=len(df))
 
         return df
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+"""Provides the necessary methods need to evaluate how the recession risk model would have performed in real time.
+- BACKTEST: Class used to refit the recession risk model at each date and collect its out-of-sample predictions.
+"""
+import os # gets the number of available cores.
+import time # measures how long the backtest takes.
+import numpy # performs operations to arrays.
+import pandas # performs operations to datasets.
+from concurrent.futures import ProcessPoolExecutor # provides modules for refitting the model in parallel processes.
+from sklearn.linear_model import LogisticRegression # allows the usage of Logistic Regression for the model.
+
+__author__ = "Alejandro Sánchez Gómez"
+__copyright__ = "Copyright 2024, Recession Dashboard"
+__license__ = "MIT license"
+__version__ = "1.0.0"
+__maintainer__ = "Alejandro Sánchez Gómez"
+__email__ = "alejandro@recession-dashboard.com"
+__status__ = "Production"
+
+def fill_forward(matrix):
+    """External method created to assist the method run from the BACKTEST class. Fills the empty cells of each column in place with the last filled cell
+    before them, so each row only uses values known at its date. Cells before the first filled cell of a column are left empty.
+    matrix: Two dimensional array.
+    """
+    rows = numpy.arange(matrix.shape[0])
+    for j in range(matrix.shape[1]):
+        column = matrix[:, j] # view of the column.
+        last = numpy.maximum.accumulate(numpy.where(numpy.isnan(column), 0, rows)) # position of the last filled cell of each row.
+        column[:] = column[last]
+
+def get_window_range(x, start, stop):
+    """External method created to assist the method run from the BACKTEST class. Returns the minimum values and the ranges (maximum minus minimum)
+    of the training rows, used to normalize the rows known at the end of the window. Constant columns get a range of 1, so they are not divided by zero.
+    x: Array of KPIs.
+    start: First training row.
+    stop: First row after the training rows.
+    """
+    window = x[start:stop]
+    low, high = numpy.fmin.reduce(window, axis=0), numpy.fmax.reduce(window, axis=0) # empty cells are ignored.
+    return low, numpy.where(high > low, high - low, 1.0)
+
+def refit_steps(x, y, steps, window_size, C):
+    """External method created to assist the method run from the BACKTEST class. Refits the model for each step of a block of consecutive steps,
+    starting each fit from the coefficients of the previous one. Each step is normalized with its training rows only, and training rows with empty cells are skipped.
+    x: Array of KPIs, forward filled.
+    y: Array of USREC values.
+    steps: Rows to predict. Each one is predicted with a model trained on the rows before it.
+    window_size: Number of rows used to train each model, or None to use all previous rows.
+    C: Inverse of the regularization strength of the model.
+    Returns an array with the risk of recession of each step, empty for the steps that cannot be predicted.
+    """
+    model = LogisticRegression(solver='lbfgs', C=C, warm_start=True, max_iter=1000) # warm_start reuses the previous coefficients as starting point.
+    probabilities = numpy.full(len(steps), numpy.nan)
+
+    for n, step in enumerate(steps):
+        start = 0 if window_size is None else max(0, step - window_size) # first row of the training dataset.
+        low, span = get_window_range(x, start, step) # normalization parameters known at the date of the step.
+        x_train, x_next = (x[start:step] - low) / span, (x[step:step + 1] - low) / span
+        filled = ~numpy.isnan(x_train).any(axis=1) # rows dated before the first value of a KPI cannot be used.
+        x_train, y_train = x_train[filled], y[start:step][filled]
+        if numpy.isnan(x_next).any(): continue # the step cannot be predicted.
+        if len(numpy.unique(y_train)) < 2: # the model cannot be trained without both recession and non recession dates.
+            if len(y_train): probabilities[n] = y_train[-1]
+            continue
+        model.fit(x_train, y_train)
+        probabilities[n] = model.predict_proba(x_next)[0, 1]
+
+    return probabilities
+
+def replica_fit(x, y, steps, train_rows):
+    """External method created to assist the method run from the BACKTEST class. Fits the model once on the first train_rows rows with the solver of
+    NRR_VALUE.fit_nrr (liblinear, which also penalizes the intercept), and predicts the steps after them with it. It is a no-lookahead replica, not the
+    production model: the KPIs are forward filled and normalized with the training rows, while fit_nrr interpolates them and normalizes them with their complete history.
+    x: Array of KPIs, forward filled.
+    y: Array of USREC values.
+    steps: Rows to predict. Steps within the training rows are left empty, as they are not out-of-sample.
+    train_rows: Number of rows used to train the model.
+    Returns an array with the risk of recession of each step, empty for the steps that cannot be predicted.
+    """
+    probabilities = numpy.full(len(steps), numpy.nan)
+    low, span = get_window_range(x, 0, train_rows)
+    x_train = (x[:train_rows] - low) / span
+    filled = ~numpy.isnan(x_train).any(axis=1)
+    if len(numpy.unique(y[:train_rows][filled])) < 2: return probabilities
+
+    model = LogisticRegression(solver='liblinear', C=1.0, random_state=0) # same solver as NRR_VALUE.fit_nrr.
+    model.fit(x_train[filled], y[:train_rows][filled])
+    x_steps = (x[steps] - low) / span
+    predictable = (steps >= train_rows) & ~numpy.isnan(x_steps).any(axis=1) # only the steps after the training rows are out-of-sample.
+    if predictable.any(): probabilities[predictable] = model.predict_proba(x_steps[predictable])[:, 1]
+    return probabilities
+
+def score(probability, actual):
+    """External method created to assist the method run from the BACKTEST class. Returns the hit rate and the Brier score of the predicted steps."""
+    valid = ~numpy.isnan(probability)
+    if not valid.any(): return numpy.nan, numpy.nan
+    hit_rate = float(numpy.mean((probability[valid] >= 0.5) == (actual[valid] >= 0.5))) # share of dates whose recession state was predicted.
+    brier = float(numpy.mean((probability[valid] - actual[valid]) ** 2)) # mean squared error of the risk of recession.
+    return hit_rate, brier
+
+class BACKTEST:
+    """Class used to refit the recession risk model at each date and collect its out-of-sample predictions.
+    Each prediction only uses data known at its date: the KPIs are forward filled instead of interpolated, and normalized with the minimum and
+    maximum values of the training rows. The refits use lbfgs, while NRR_VALUE.fit_nrr uses liblinear, which also penalizes the intercept, so a
+    liblinear replica, fitted once on the first NRR_VALUE.train_rows rows with the same no-lookahead features, is scored on the dates after them for comparison.
+    """
+    def __init__(self, nrr_value, min_train=300, window_size=None, max_workers=None, C=1.0):
+        """Initializes the backtest.
+        nrr_value: NRR_VALUE object whose KPIs are used.
+        min_train: Number of rows used to train the first model.
+        window_size: Number of rows used to train each model (rolling window), or None to use all previous rows (expanding window).
+        max_workers: Maximum number of parallel processes. If not given, the number of cores is used.
+        C: Inverse of the regularization strength of the model.
+        """
+        self.nrr_value = nrr_value
+        self.min_train = min_train
+        self.window_size = window_size
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.C = C
+        self.results = None
+        self.metrics = None
+
+    def get_results(self):
+        """Returns the timeseries dataframe with the out-of-sample risk of recession, its level, the risk of the liblinear replica and the USREC value of each date."""
+        return self.results
+
+    def get_metrics(self):
+        """Returns a dictionary with the number of refits, the time spent, and the hit rate and Brier score of the backtest and of the liblinear replica."""
+        return self.metrics
+
+    def run(self):
+        """Refits the model at each date after the first min_train rows and predicts the next date. The dates are split into blocks of
+        consecutive dates, refitted in parallel processes, so each fit within a block starts from the coefficients of the previous one.
+        Returns the timeseries dataframe with the out-of-sample predictions.
+        """
+        start = time.perf_counter()
+        grid, names, matrix = self.nrr_value.list_join(dtype=numpy.float64) # KPIs aligned on the dates of USREC, neither normalized nor filled.
+        target = names.index('USREC')
+        x = numpy.delete(matrix, target, axis=1)
+        y = matrix[:, target]
+        fill_forward(x) # each row only uses values known at its date.
+
+        steps = numpy.arange(self.min_train, len(x)) # rows predicted out-of-sample.
+        blocks = [block for block in numpy.array_split(steps, min(self.max_workers, max(len(steps), 1))) if len(block)] # one block of consecutive rows per process.
+        with ProcessPoolExecutor(max_workers=max(len(blocks), 1)) as executor:
+            futures = [executor.submit(refit_steps, x, y, block, self.window_size, self.C) for block in blocks]
+            probability = numpy.concatenate([future.result() for future in futures]) if futures else numpy.empty(0)
+        replica = replica_fit(x, y, steps, self.nrr_value.train_rows) # liblinear replica, fitted once.
+
+        actual = y[steps]
+        self.results = pandas.DataFrame({ # builds the timeserie dataframe of the out-of-sample predictions.
+            'date': grid[steps],
+            'nrr': numpy.where(numpy.isnan(probability), numpy.nan, self.nrr_value.classify_risk(probability)), # steps that cannot be predicted have no level.
+            'probability': probability,
+            'replica_probability': replica,
+            'USREC': actual
+        })
+        hit_rate, brier = score(probability, actual)
+        replica_hit_rate, replica_brier = score(replica, actual) # only the steps after its training rows are scored.
+        self.metrics = {
+            'refits': len(steps),
+            'seconds': time.perf_counter() - start,
+            'hit_rate': hit_rate,
+            'brier': brier,
+            'replica_hit_rate': replica_hit_rate,
+            'replica_brier': replica_brier
+        }
+        print(f"Backtest of {self.metrics['refits']} refits done in {self.metrics['seconds']:.2f}s. Hit rate: {hit_rate:.3f}, Brier score: {brier:.4f}"
+              f" (liblinear replica: {replica_hit_rate:.3f}, {replica_brier:.4f})")
+
+        return self.results
@@ -3,10 +3,9 @@
 """Provides the necessary methods need to store data regarding the KPIs used to calculate the risk of recession.
 - KPI: Class used to store all methods need to store the KPIs data. 
 """
-import os # access Window's system environmental variables in order to authentificate to Azure Blob Storage.
-import io # transforms data into a stream of in-memory bytes.
-from azure.storage.blob import BlobServiceClient # uploads data in Azure Blob Storage.
+import os # access the system environmental variables in order to select the layout of the Data Warehouse.
 from etl import api # imports the API module in order to extract and transform the data we need.
+from etl import storage # imports the storage module in order to load the data into our Data Warehouse.
 
 __author__ = "Alejandro Sánchez Gómez"
 __copyright__ = "Copyright 2024, Recession Dashboard"
@@ -18,6 +17,7 @@ __status__ = "Production"
 
 class KPI:
     """Class used to store all methods need to store the KPIs data."""    
+    layout = os.environ.get("NRR_KPI_LAYOUT", "blob") # "blob" stores each KPI as a single blob, "partitioned" stores one blob per year plus a manifest.
     
     def __init__(self, kpi_name):
         """Initializes the KPI and sets its name.
@@ -41,15 +41,19 @@ class KPI:
         """Returns the dataframe from the KPI."""
         return self.data
     
-    def upload_data_azure(self):
-        """Loads the KPIs dataframes into our Data Warehouse located at Azure Blob Storage."""
+    def get_upload(self):
+        """Returns the container, blob name and in-memory bytes stream of the KPI dataframe to load into our Data Warehouse, serialized in the storage.SERIALIZER format."""
+        writer, extension = storage.SERIALIZER.serialize(self.data) # stores the KPI timeserie through the conversion from pandas dataframe to in-memory bytes.
 
-        connect_str = os.getenv('KEY_NRR_DATA') # gets the key needed to authentificate into our Data Warehouse.
-        blob_service_client = BlobServiceClient.from_connection_string(connect_str) # authentificates into the Data Warehouse hosted at Azure Blob Storage.
-        blob_client = blob_service_client.get_blob_client(
-            container = "container-kpi", blob = self.get_name()) # create a blob in the "container-kpi" container which will store the KPI dataframe.
+        return "container-kpi", self.get_name() + extension, writer # the "container-kpi" container stores the KPI dataframes.
 
-        writer = io.BytesIO() # prepares the bytes streamer.
-        self.data.to_csv(writer) # stores the RRL timeserie as CSV through the conversion from pandas dataframe to in-memory bytes.
-        
-        blob_client.upload_blob(writer.getvalue(), overwrite = True) # uploads it into the Data Warehouse.
+    def get_partitioned_uploads(self):
+        """Returns the uploads of the changed years of the KPI dataframe, and the upload of its new manifest (None if nothing changed), for the "partitioned" layout."""
+        return storage.PARTITIONS.get_uploads("container-kpi", self.get_name(), self.data)
+
+    def upload_data_azure(self):
+        """Loads the KPIs dataframes into our Data Warehouse located at Azure Blob Storage."""
+        if KPI.layout == "partitioned":
+            storage.PARTITIONS.upload("container-kpi", self.get_name(), self.data) # uploads only the changed years.
+        else:
+            storage.STORAGE.upload(*self.get_upload()) # uploads it into the Data Warehouse through the shared client.
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+"""Provides the necessary methods need to know where a run spends its time and memory.
+- STAGE: Class used to measure a single execution of a stage of the run (fetch, parse, transform, normalize, unify, fit, predict or upload).
+- METRICS: Class used to collect the measures of all stages per KPI, and to export them as JSON or OpenMetrics text.
+"""
+import os # access the system environmental variables in order to configure the metrics.
+import sys # checks the platform in order to read the peak memory.
+import time # measures how long each stage takes.
+import json # exports the metrics as JSON.
+import threading # collects the metrics of parallel stages safely.
+import tracemalloc # measures the peak memory allocated by Python, if enabled.
+import cProfile # profiles the run, if enabled.
+import pstats # joins the profiles of all threads.
+try: # the resource module is not available on Windows.
+    import resource # reads the peak memory of the process.
+except ImportError:
+    resource = None
+
+__author__ = "Alejandro Sánchez Gómez"
+__copyright__ = "Copyright 2024, Recession Dashboard"
+__license__ = "MIT license"
+__version__ = "1.0.0"
+__maintainer__ = "Alejandro Sánchez Gómez"
+__email__ = "alejandro@recession-dashboard.com"
+__status__ = "Production"
+
+def profile_thread(frame, event, arg):
+    """External method created to assist the METRICS class. Installed with threading.setprofile, it starts a profiler on each new thread
+    (such as the KPI and U.S.Treasury workers), which replaces this method as the profiler of the thread.
+    """
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError: # Python 3.12+ only allows one active profiler, which already covers all threads.
+        sys.setprofile(None)
+        return
+    with METRICS.lock:
+        METRICS.thread_profilers.append(profiler)
+
+def get_peak_rss():
+    """External method created to assist the METRICS class. Returns the peak resident memory of the process in bytes, or None if it is not available."""
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # Linux reports kilobytes, macOS reports bytes.
+
+class STAGE:
+    """Class used to measure a single execution of a stage of the run (fetch, parse, transform, normalize, unify, fit, predict or upload)."""
+    def __init__(self, name, kpi=None):
+        """Initializes the measure.
+        name: Name of the stage.
+        kpi: Optional name of the KPI, timeserie or blob the stage works on.
+        """
+        self.name = name
+        self.kpi = kpi or "all"
+        self.rows = 0 # rows produced by the stage.
+        self.bytes = 0 # bytes downloaded or uploaded by the stage.
+        self.cache_hits = 0 # requests answered from the local store instead of the network.
+        self.peak = None # peak memory allocated by Python during the stage, if it can be attributed to it.
+
+    def add(self, rows=0, bytes=0, cache_hits=0):
+        """Adds rows produced, bytes downloaded or uploaded, and requests answered from the local store by the stage."""
+        self.rows = self.rows + (rows or 0)
+        self.bytes = self.bytes + (bytes or 0)
+        self.cache_hits = self.cache_hits + (cache_hits or 0)
+
+    def __enter__(self):
+        self.attributable = self.name in METRICS.sequential and tracemalloc.is_tracing() # parallel stages share the peak with each other.
+        if self.attributable: METRICS.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        if self.attributable: self.peak = tracemalloc.get_traced_memory()[1]
+        METRICS.record(self, seconds)
+        return False # exceptions are not swallowed.
+
+class METRICS:
+    """Class used to collect the measures of all stages per KPI, and to export them as JSON or OpenMetrics text.
+    Executions of the same stage and KPI (such as the yearly requests of the U.S.Treasury) are added together.
+    The peak memory allocated by Python is measured per stage only for the stages that run alone (NRR_TRACE_MEMORY=1). Stages that run in parallel
+    threads (fetch, parse, transform and upload) cannot be told apart, so they have no peak. The peak resident memory and the peak memory allocated
+    by Python are also given for the whole run.
+    NRR_PROFILE profiles the main thread and every thread started during the run, such as the extraction and upload workers.
+    """
+    stages = {} # measures by (stage, kpi).
+    lock = threading.Lock() # collects the measures of parallel stages safely.
+    sequential = {"normalize", "unify", "fit", "predict"} # stages that never run at the same time as another stage.
+    output = os.environ.get("NRR_METRICS_FILE") # file where the metrics are exported: OpenMetrics text if it ends with ".prom", JSON otherwise.
+    trace_memory = os.environ.get("NRR_TRACE_MEMORY") == "1" # measures the peak memory allocated by Python with tracemalloc.
+    profile_output = os.environ.get("NRR_PROFILE") # file where the cProfile statistics of the run are dumped, if set.
+    profiler = None
+    thread_profilers = [] # profilers of the threads started during the run.
+    tracing = False # tracemalloc was started by METRICS.start, so METRICS.stop stops it.
+    python_peak = None # peak memory allocated by Python during the run, before the last reset of the tracemalloc peak.
+
+    def stage(name, kpi=None):
+        """Returns a STAGE to measure with a "with" statement.
+        name: Name of the stage.
+        kpi: Optional name of the KPI, timeserie or blob the stage works on.
+        """
+        return STAGE(name, kpi)
+
+    def reset_peak():
+        """Keeps the peak memory allocated by Python so far as the peak of the run, and resets it, so the next stage measures its own peak."""
+        with METRICS.lock:
+            METRICS.python_peak = max(METRICS.python_peak or 0, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+    def get_python_peak():
+        """Returns the peak memory allocated by Python during the run, or None if tracemalloc is not tracing."""
+        if not tracemalloc.is_tracing(): return METRICS.python_peak
+        with METRICS.lock:
+            return max(METRICS.python_peak or 0, tracemalloc.get_traced_memory()[1])
+
+    def record(stage, seconds):
+        """Adds the measure of a stage execution to the metrics."""
+        with METRICS.lock:
+            item = METRICS.stages.setdefault((stage.name, stage.kpi), {"stage": stage.name, "kpi": stage.kpi, "calls": 0, "seconds": 0.0, "rows": 0, "bytes": 0,
+                                                                       "cache_hits": 0, "peak_python_bytes": None})
+            item["calls"] = item["calls"] + 1
+            item["seconds"] = item["seconds"] + seconds
+            item["rows"] = item["rows"] + stage.rows
+            item["bytes"] = item["bytes"] + stage.bytes
+            item["cache_hits"] = item["cache_hits"] + stage.cache_hits
+            if stage.peak is not None: item["peak_python_bytes"] = max(item["peak_python_bytes"] or 0, stage.peak)
+
+    def get_stages():
+        """Returns the list of measures, one dictionary per stage and KPI."""
+        with METRICS.lock:
+            return [dict(item) for item in METRICS.stages.values()]
+
+    def start():
+        """Clears the metrics and starts tracemalloc and cProfile, if enabled."""
+        with METRICS.lock:
+            METRICS.stages = {}
+            METRICS.python_peak = None
+            METRICS.thread_profilers = []
+        METRICS.tracing = METRICS.trace_memory and not tracemalloc.is_tracing() # tracemalloc started by someone else is left running.
+        if METRICS.tracing: tracemalloc.start()
+        if METRICS.profile_output:
+            METRICS.profiler = cProfile.Profile()
+            METRICS.profiler.enable()
+            threading.setprofile(profile_thread) # profiles the threads started from now on.
+
+    def stop():
+        """Stops tracemalloc and cProfile, dumps the profile and exports the metrics, if enabled.
+        Returns the list of measures.
+        """
+        if METRICS.profiler is not None:
+            METRICS.profiler.disable()
+            threading.setprofile(None)
+            stats = pstats.Stats(METRICS.profiler)
+            for profiler in METRICS.thread_profilers: stats.add(profiler) # the worker threads have already finished.
+            stats.dump_stats(METRICS.profile_output) # readable with the pstats module or snakeviz.
+            METRICS.profiler = None
+            METRICS.thread_profilers = []
+        METRICS.python_peak = METRICS.get_python_peak()
+        if METRICS.tracing:
+            tracemalloc.stop()
+            METRICS.tracing = False
+        if METRICS.output: METRICS.export(METRICS.output)
+        return METRICS.get_stages()
+
+    def to_json():
+        """Returns the metrics as a JSON string."""
+        return json.dumps({"timestamp": time.time(), "peak_rss_bytes": get_peak_rss(), "peak_python_bytes": METRICS.get_python_peak(),
+                           "stages": METRICS.get_stages()}, indent=1)
+
+    def to_openmetrics():
+        """Returns the metrics as OpenMetrics text."""
+        fields = [("seconds", "nrr_stage_seconds", "counter", "Time spent in the stage."),
+                  ("calls", "nrr_stage_calls", "counter", "Executions of the stage."),
+                  ("rows", "nrr_stage_rows", "counter", "Rows produced by the stage."),
+                  ("bytes", "nrr_stage_bytes", "counter", "Bytes downloaded or uploaded by the stage."),
+                  ("cache_hits", "nrr_stage_cache_hits", "counter", "Requests of the stage answered from the local store."),
+                  ("peak_python_bytes", "nrr_stage_peak_python_bytes", "gauge", "Peak memory allocated by Python during the stage, only for stages that run alone.")]
+        stages = METRICS.get_stages()
+        lines = []
+        for key, metric, kind, help in fields:
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"# HELP {metric} {help}")
+            for item in stages:
+                if item[key] is None: continue
+                suffix = "_total" if kind == "counter" else ""
+                lines.append(f'{metric}{suffix}{{stage="{item["stage"]}",kpi="{item["kpi"]}"}} {item[key]}')
+        for metric, help, value in [("nrr_run_peak_rss_bytes", "Peak resident memory of the process.", get_peak_rss()),
+                                    ("nrr_run_peak_python_bytes", "Peak memory allocated by Python during the run.", METRICS.get_python_peak())]:
+            if value is None: continue
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"# HELP {metric} {help}")
+            lines.append(f"{metric} {value}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def export(path):
+        """Writes the metrics into a file: OpenMetrics text if it ends with ".prom", JSON otherwise."""
+        with open(path, "w") as file:
+            file.write(METRICS.to_openmetrics() if path.endswith(".prom") else METRICS.to_json())
+        print(f"Metrics exported to {path}")
@@ -4,10 +4,13 @@
 - NRR_VALUE: Class used to store all methods that will be used to calculate the risk of recession. 
 """
 import os # access Window's system environmental variables in order to authentificate to Azure Blob Storage.
-import io # transforms data into a stream of in-memory bytes.
+import numpy # performs operations to arrays.
 import pandas # performs operations to datasets.
-from azure.storage.blob import BlobServiceClient # uploads data in Azure Blob Storage.
+import hashlib # identifies the training data of the model by its hash.
 from sklearn.linear_model import LogisticRegression # allows the usage of Logistic Regression for the model.
+from etl import store # stores the fitted models locally, so they do not have to be trained again on every run.
+from etl import storage # loads the data into our Data Warehouse.
+from etl import metrics # measures the time and rows of each stage.
 
 __author__ = "Alejandro Sánchez Gómez"
 __copyright__ = "Copyright 2024, Recession Dashboard"
@@ -17,12 +20,35 @@ __maintainer__ = "Alejandro Sánchez Gómez"
 __email__ = "alejandro@recession-dashboard.com"
 __status__ = "Production"
 
+def fill_columns(matrix):
+    """External method created to assist the method get_model_data from the NRR_VALUE class. Fills the empty cells of each column in place,
+    with the linear interpolation of the filled cells around them, or the closest filled cell before the first or after the last one.
+    It is the same as interpolating linearly from the next filled cell backwards and then from the last filled cell forwards.
+    matrix: Two dimensional array. Columns without any filled cell are left empty.
+    """
+    rows = numpy.arange(matrix.shape[0])
+    for j in range(matrix.shape[1]):
+        column = matrix[:, j] # view of the column.
+        empty = numpy.isnan(column)
+        if not empty.any() or empty.all(): continue
+        column[empty] = numpy.interp(rows[empty], rows[~empty], column[~empty])
+
 class NRR_VALUE:
     """Class used to store all methods that will be used to calculate the risk of recession."""
-    def __init__(self, list_kpi):
+    start_date = "1990-01-01" # first date used to calculate the recession risk.
+    risk_edges = [0.075, 0.15, 0.225, 0.3] # recession risk thresholds that separate the recession risk levels.
+    risk_levels = [5, 4, 3, 2, 1] # recession risk levels from the lowest to the highest risk: Safe, Low, Moderate, High and Extreme.
+    train_rows = 300 # number of rows of the trainning dataset, which contain 3 major recessions.
+    rescore_rows = 6 # number of last stored predictions calculated again in "score" mode, as their KPIs may have been filled or revised.
+    mode = os.environ.get("NRR_MODE", "fit") # "fit" trains the model on every run, "score" reuses the stored model and only predicts the new rows.
+
+    def __init__(self, list_kpi, mode=None):
         """Initializes the class and calculates the recession risk.
         list_kpi: List of all KPIs needed to calculate the recession risk. 
+        mode: Optional "fit" or "score" mode. If not given, NRR_VALUE.mode is used.
         """
+        self.mode = mode or NRR_VALUE.mode
+        self.norm_params = {} # minimum and maximum values used to normalize each column of the KPIs.
         self.set_kpis(list_kpi) # stores the list of KPIs needed.
         self.calculate_nrr() # calculates the recession risk level.
 
@@ -30,10 +56,10 @@ class NRR_VALUE:
         """Stores the list of KPIs needed. If the list does not have the correct format, it will throw exceptions.
         list: List of all KPIs needed to calculate the recession risk. 
         """
-        expected_length = 9 # number of dataframes that must be contained in the list.
+        min_length = 2 # the list must contain USREC and, at least, another KPI.
         try:
-            if len(list) != expected_length: # throws ValueError if the number of dataframes is not correct.
-                raise ValueError(f"The list must contain exactly {expected_length} DataFrames. Found {len(list)} instead.")
+            if len(list) < min_length: # throws ValueError if the number of dataframes is not correct.
+                raise ValueError(f"The list must contain at least {min_length} DataFrames. Found {len(list)} instead.")
             if 'USREC' not in list[0].columns: # throws KeyError if the dataframe USREC is not the first one stored.
                 raise KeyError("The first DataFrame must contain a column named 'USREC'.")
             for item in list: # throws TypeError if the list contains an element that it is not a dataframe.
@@ -60,81 +86,155 @@ class NRR_VALUE:
         return self.nrr_table
     
     # OPERATIONS
-    def list_normalize(self):
-        """Normalized the data contained inside the list of KPIs."""
+    def get_norm_params(self):
+        """Returns a dictionary with the minimum and maximum values used to normalize each column of the KPIs."""
+        return self.norm_params
+
+    def list_normalize(self, params=None):
+        """Calculates the minimum and maximum values used to normalize each column of the KPIs, and stores them as the normalization parameters.
+        The KPIs are not modified nor copied: their values are normalized later, straight into the joined matrix built by list_join.
+        params: Optional dictionary with the minimum and maximum values of each column. If not given, they are calculated from the KPIs.
+        Returns the dictionary of normalization parameters.
+        """
+        norm_params = {} # minimum and maximum values used to normalize each column.
+
+        for elem in self.get_kpis():
+            for col in elem.columns.drop('date'):
+                if params is not None: # uses the given values instead.
+                    norm_params[col] = [float(params[col][0]), float(params[col][1])]
+                    continue
+                values = elem[col].to_numpy(dtype=float) # float columns are read without copying them.
+                filled = not numpy.isnan(values).all()
+                norm_params[col] = [float(numpy.nanmin(values)) if filled else numpy.nan, float(numpy.nanmax(values)) if filled else numpy.nan]
+
+        self.norm_params = norm_params
+        return norm_params
+
+    def get_training_digest(self):
+        """Calculates the hash of the data used to train the model: the rows of every KPI dated before the first prediction date.
+        Returns a hexadecimal string, or None if there are not enough rows to train the model.
+        """
         list_df = self.get_kpis()
+        dates = list_df[0]['date']
+        grid = dates[dates >= pandas.Timestamp(NRR_VALUE.start_date)] # dates used to calculate the recession risk.
+        if len(grid) <= self.train_rows: return None
+        train_end = grid.iloc[self.train_rows] # first prediction date.
 
-        n = 0
-        for elem in list_df: 
-            elem_copy = elem
-            elem_date = elem_copy['date'] # separates the dataframe from columns that are not labeled as "date".
-            elem_value = elem_copy.drop(columns=['date']) # separates the dataframe from the "date" column.
-            elem_value = (elem_value - elem_value.min())/(elem_value.max()-elem_value.min()) # normalized values in a range between 0 and 1 using the min max method.
-            elem = pandas.concat([elem_date, elem_value], axis=1) # unites the columns into a single dataframe.
-            list_df[n] = elem # updates each element of the list of KPIs.
-            n = n+1
-        
-        self.set_kpis(list_df) # updates the list of KPIs.
+        digest = hashlib.sha256(f"{self.train_rows}".encode())
+        for elem in list_df: # adds the columns, dates and values of the trainning rows of each KPI to the hash.
+            rows = elem[elem['date'] < train_end]
+            digest.update(",".join(map(str, rows.columns)).encode())
+            digest.update(rows['date'].to_numpy(dtype='datetime64[ns]').tobytes())
+            digest.update(rows.drop(columns=['date']).to_numpy(dtype=float).tobytes())
+        return digest.hexdigest()
 
-    def list_unify(self):
-        
+    def list_join(self, asof=False, params=None, dtype=numpy.float32):
+        """Joins the list of KPIs into a single matrix, aligned in one pass on the dates of the first KPI (USREC) from NRR_VALUE.start_date onwards.
+        Each column of the matrix is contiguous, and only the values of the aligned dates are read from the KPIs, so the KPIs are never copied.
+        asof: If True, KPIs more frequent than the first one (daily series such as VIXCLS or the Treasury yield curve) take their last value on or before
+        the end of each month, instead of the value of that exact date.
+        params: Optional dictionary with the minimum and maximum values of each column. If given, the values are normalized in place, in the matrix.
+        dtype: NumPy datatype of the matrix.
+        Returns the array of dates, the list of column names and the matrix.
+        """
         list_df = self.get_kpis()
 
-        n = 0
-        for elem in list_df: # iterates the list in order to get each dataframe and then performs left join in the previous stored dataframe of the iteration.
-            if(n==0):
-                table = elem
-            else:
-                table = pandas.merge(prev, elem, on="date", how="left")
-            prev = table
-            n = n + 1
-        
-        table = table.iloc[852:] # removes rows that contain dates before 1990.
+        base_dates = list_df[0]['date'].to_numpy()
+        grid = base_dates[base_dates >= numpy.datetime64(NRR_VALUE.start_date)] # removes dates before 1990 before unifying the KPIs.
+        grid_step = numpy.median(numpy.diff(grid)) if len(grid) > 1 else None # usual distance between two dates of the first KPI.
+        month_ends = (pandas.DatetimeIndex(grid) + pandas.offsets.MonthEnd(0)).to_numpy(dtype=grid.dtype) # last day of the month of each date.
+
+        names = [n for elem in list_df for n in elem.columns.drop('date')] # columns of the joined matrix.
+        matrix = numpy.full((len(grid), len(names)), numpy.nan, dtype=dtype, order='F') # dates without value are left empty.
+        j = 0 # column of the matrix being filled.
+        for elem in list_df: # maps the dates of each KPI onto the dates of the first KPI, then takes the values of each column at once.
+            if not elem['date'].is_monotonic_increasing: elem = elem.sort_values('date', kind='stable')
+            dates = elem['date'].to_numpy(dtype=grid.dtype)
+            frequent = grid_step is not None and len(dates) > 1 and numpy.median(numpy.diff(dates)) < grid_step # the KPI has more than one value per date of the first KPI.
+
+            if not (asof and frequent): # position of the value of each exact date, shared by all the columns of the KPI.
+                pos = numpy.searchsorted(dates, grid, side='left')
+                found = pos < len(dates)
+                found[found] = dates[pos[found]] == grid[found]
+
+            for n in elem.columns.drop('date'):
+                column = elem[n].to_numpy(dtype=float) # float columns are read without copying them.
+                if asof and frequent: # position of the last filled value on or before the end of each month.
+                    filled = ~numpy.isnan(column)
+                    column = column[filled]
+                    pos = numpy.searchsorted(dates[filled], month_ends, side='right') - 1
+                    found = pos >= 0
+
+                values = matrix[:, j] # view of the column of the matrix.
+                values[found] = column[pos[found]]
+                if params is not None: # min max normalization in a range between 0 and 1, in place.
+                    with numpy.errstate(divide='ignore', invalid='ignore'): # constant columns are left empty, as pandas does.
+                        values -= params[n][0]
+                        values /= params[n][1] - params[n][0]
+                j = j + 1
+
+        return grid, names, matrix
+
+    def list_unify(self, asof=False, params=None):
+        """Unifies the list of KPIs into a single dataframe, aligned in one pass on the dates of the first KPI (USREC) from NRR_VALUE.start_date onwards.
+        asof: If True, KPIs more frequent than the first one take their last value on or before the end of each month, instead of the value of that exact date.
+        params: Optional dictionary with the minimum and maximum values of each column. If given, the values are normalized.
+        """
+        grid, names, matrix = self.list_join(asof, params, numpy.float64)
+        table = pandas.DataFrame({'date': grid, **{n: matrix[:, j] for j, n in enumerate(names)}}) # creates the unified dataframe at once.
 
         return table
 
-    def calculate_nrr(self):
-        """Calculates the risk of recesion for each date and stores the values into a dataframe."""
-        self.list_normalize() # normalizes list of KPIs needed.
-        table = self.list_unify() # unifies the list of KPIs into a single dataframe.
+    def classify_risk(self, probabilities):
+        """Classifies the risks of recession into recession risk levels, all at once. A risk lower than the first edge gets the first level,
+        a risk between two edges gets the level between them, and a risk equal or higher than the last edge gets the last level.
+        probabilities: Array of risks of recession between 0 and 1.
+        Returns an array with the recession risk levels.
+        """
+        if len(self.risk_levels) != len(self.risk_edges) + 1: # throws ValueError if the levels do not match the edges.
+            raise ValueError(f"There must be exactly one more risk level than risk edges. Found {len(self.risk_levels)} levels and {len(self.risk_edges)} edges instead.")
+        return numpy.asarray(self.risk_levels)[numpy.digitize(probabilities, self.risk_edges)]
 
-        table_no_date = table.drop(columns=['date']) # copies the unified KPIs table with the "date" column removed.
-        table_date = table['date'] # copies the unified KPIs table with only "date" column.
-        table_x = table_no_date.drop(columns=['USREC']) # copies the table without dates with the "USREC" column removed.
-        table_y = table_no_date['USREC'] # copies the table without dates with only "USREC" column.
+    def get_model_data(self, params=None):
+        """Normalizes and unifies the KPIs into a single float32 matrix, and fills its empty cells. The KPIs are neither modified nor copied.
+        params: Optional dictionary with the minimum and maximum values used to normalize each column.
+        Returns the "date" column, the table of KPIs without the "USREC" column, and the "USREC" column.
+        """
+        with metrics.METRICS.stage("normalize") as stage:
+            norm_params = self.list_normalize(params) # minimum and maximum values of each column.
+            stage.add(rows=sum(len(elem) for elem in self.get_kpis()))
+        with metrics.METRICS.stage("unify") as stage:
+            grid, names, matrix = self.list_join(params=norm_params) # unifies and normalizes the list of KPIs into a single matrix.
+            stage.add(rows=len(grid))
 
-        table_x.interpolate(method ='linear', limit_direction ='backward', inplace=True) # fills empty cells with the linear interpolate method from the next filled cell backwards.
-        table_x.interpolate(method ='linear', limit_direction ='forward', inplace=True) # fills empty cells with the linear interpolate method from the last filled cell forwards.
+        y = names.index('USREC')
+        matrix_x = matrix[:, 1:] if y == 0 else numpy.delete(matrix, y, axis=1) # view of the matrix without the "USREC" column.
+        fill_columns(matrix_x) # fills empty cells once, on the joined matrix.
 
-        z = 300 # creates the trainning dataset by selecting the rows that contain 3 major recessions
-        x = table_x.iloc[:z] 
-        y = table_y.iloc[:z]
-        x_test = table_x.iloc[z:] # creates the prediction dataset by selecting the rest of rows
+        table_date = pandas.Series(grid, name='date') # "date" column.
+        table_x = pandas.DataFrame(matrix_x, columns=[n for n in names if n != 'USREC'], copy=False) # table of KPIs without the "USREC" column.
+        table_y = pandas.Series(matrix[:, y], name='USREC') # "USREC" column.
 
-        try: # trains the model used to calculate the recession risk levels. If it fails, throws an Exception. 
-            model = LogisticRegression(solver='liblinear', C=1.0, random_state=0) # creates the model using Logistic Regression.
-            model.fit(x, y) # trains the model using Logistic Regression.
-            x_pred = model.predict_proba(x_test) # calculates the risk of entering a recession using the previous trained model and the prediction dataset
+        return table_date, table_x, table_y
 
-            list_nrr = [] # initializing the list used to store the recession risk levels.
-            list_dates = [] # initializing the list used to store the dates regarding the recession risk levels.
-
-            for elem in x_pred: # classificates the risk of recession with the following levels: Extreme, Safe, Low, Moderate and High. 
-                value = 1
-                if elem[1] < 0.075: 
-                    value = 5
-                elif elem[1] < 0.15: 
-                    value = 4
-                elif elem[1] < 0.225: 
-                    value = 3
-                elif elem[1] < 0.3: 
-                    value = 2
-
-                list_nrr.append(value)  # stores the recession risk levels.
-                list_dates.append(table_date.iloc[z]) # stores the dates of the recession risk levels.
-                z = z+1
-
-            dataframe = pandas.DataFrame(list(zip(list_dates, list_nrr)),columns=['date','nrr']) # combines both lists into a single timeserie dataframe.
+    def calculate_nrr(self):
+        """Calculates the risk of recesion for each date and stores the values into a dataframe.
+        In "score" mode, if a model trained on the same data is stored, it is reused and only the new rows are predicted.
+        """
+        digest = self.get_training_digest() # identifies the trainning data.
+        artifact = store.MODEL_STORE.get_model(digest) if self.mode == "score" and digest else None # model trained on the same data, if any.
+
+        try: # trains the model used to calculate the recession risk levels. If it fails, throws an Exception. 
+            if artifact is None:
+                self.fit_nrr(digest)
+            else:
+                self.score_nrr(digest, artifact)
+            scores = self.scores if artifact is None else store.MODEL_STORE.get_scores(digest) # all predictions of the model.
+            dataframe = pandas.DataFrame({ # builds the timeserie dataframe straight from the predictions.
+                'date': scores['date'].to_numpy(),
+                'nrr': self.classify_risk(scores['probability'].to_numpy()),
+                'probability': scores['probability'].to_numpy()
+            })
             
         except Exception as e:
              print(f"An unexpected error occurred: {e}")
@@ -143,15 +243,62 @@ class NRR_VALUE:
         
         self.set_nrr_table(dataframe) # stores the recession risk level timeserie dataframe.
 
+    def fit_nrr(self, digest):
+        """Trains the model on the first rows, predicts the rest, and stores the model, its normalization parameters and its predictions.
+        digest: Hash of the trainning data.
+        """
+        table_date, table_x, table_y = self.get_model_data() # normalizes and unifies the KPIs.
 
-    def upload_nrr_azure(self):
-        """Loads the Recession Risk Level timeserie dataframe into our Data Warehouse located at Azure Blob Storage."""
-        connect_str = os.getenv('KEY_NRR_DATA') # gets the key needed to authentificate into our Data Warehouse.
-        blob_service_client = BlobServiceClient.from_connection_string(connect_str) # authentificates into the Data Warehouse hosted at Azure Blob Storage.
-        blob_client = blob_service_client.get_blob_client(
-            container = "container-nrr", blob = "nrr_table") # create the "nrr_table" blob in the "container-nrr" container which will store the RRL timeserie.
+        z = self.train_rows # creates the trainning dataset by selecting the rows that contain 3 major recessions
+        x = table_x.iloc[:z] 
+        y = table_y.iloc[:z]
+        x_test = table_x.iloc[z:] # creates the prediction dataset by selecting the rest of rows
 
-        writer = io.BytesIO() # prepares the bytes streamer.
-        self.get_nrr_table().to_csv(writer) # stores the RRL timeserie as CSV through the conversion from pandas dataframe to in-memory bytes.
+        with metrics.METRICS.stage("fit") as stage:
+            model = LogisticRegression(solver='liblinear', C=1.0, random_state=0) # creates the model using Logistic Regression.
+            model.fit(x, y) # trains the model using Logistic Regression.
+            stage.add(rows=len(x))
+        with metrics.METRICS.stage("predict") as stage:
+            x_pred = model.predict_proba(x_test) # calculates the risk of entering a recession using the previous trained model and the prediction dataset
+            stage.add(rows=len(x_pred))
+
+        self.scores = pandas.DataFrame({'date': table_date.iloc[z:].to_numpy(), 'probability': x_pred[:, 1]}) # risk of entering a recession for each date.
+        if digest is None: return
+        store.MODEL_STORE.set_model(digest, { # stores everything needed to predict new rows without trainning the model again.
+            'columns': list(table_x.columns),
+            'coef': model.coef_[0].tolist(),
+            'intercept': float(model.intercept_[0]),
+            'norm_params': self.get_norm_params()
+        })
+        store.MODEL_STORE.set_scores(digest, self.scores)
+
+    def score_nrr(self, digest, artifact):
+        """Predicts the rows after the last stored prediction with the stored model and its normalization parameters, and stores them.
+        The last NRR_VALUE.rescore_rows stored predictions are calculated again.
+        digest: Hash of the trainning data.
+        artifact: Dictionary with the stored model.
+        """
+        table_date, table_x, table_y = self.get_model_data(artifact['norm_params']) # normalizes the KPIs with the stored parameters.
 
-        blob_client.upload_blob(writer.getvalue(), overwrite = True) # uploads it into the Data Warehouse.     
+        stored = store.MODEL_STORE.get_scores(digest)['date'] # dates already predicted.
+        first = self.train_rows # first row to predict.
+        if len(stored) > self.rescore_rows:
+            first = max(first, int(numpy.searchsorted(table_date.to_numpy(), stored.iloc[-self.rescore_rows].to_datetime64())))
+
+        with metrics.METRICS.stage("predict") as stage:
+            x_new = table_x[artifact['columns']].iloc[first:].to_numpy(dtype=float) # new rows, with the columns in the order used to train the model.
+            decision = x_new @ numpy.asarray(artifact['coef']) + artifact['intercept']
+            stage.add(rows=len(x_new))
+        self.scores = pandas.DataFrame({'date': table_date.iloc[first:].to_numpy(), 'probability': 1 / (1 + numpy.exp(-decision))}) # risk of entering a recession for each new date.
+        store.MODEL_STORE.set_scores(digest, self.scores)
+        print(f"Recession risk scored for {len(self.scores)} new rows with the stored model.")
+
+    def get_upload(self):
+        """Returns the container, blob name and in-memory bytes stream of the Recession Risk Level timeserie dataframe to load into our Data Warehouse, serialized in the storage.SERIALIZER format."""
+        writer, extension = storage.SERIALIZER.serialize(self.get_nrr_table()) # stores the RRL timeserie through the conversion from pandas dataframe to in-memory bytes.
+
+        return "container-nrr", "nrr_table" + extension, writer # the "nrr_table" blob in the "container-nrr" container stores the RRL timeserie.
+
+    def upload_nrr_azure(self):
+        """Loads the Recession Risk Level timeserie dataframe into our Data Warehouse located at Azure Blob Storage."""
+        storage.STORAGE.upload(*self.get_upload()) # uploads it into the Data Warehouse through the shared client.
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+"""Provides the necessary methods need to know which KPIs are used by the system.
+- KPI_REGISTRY: Class used to read the catalogue of KPIs from a JSON file and select which of them have to be computed.
+"""
+import os # access the system environmental variables in order to locate the catalogue of KPIs.
+import json # reads the catalogue of KPIs.
+from etl import api # imports the API module in order to check the API of each KPI.
+
+__author__ = "Alejandro Sánchez Gómez"
+__copyright__ = "Copyright 2024, Recession Dashboard"
+__license__ = "MIT license"
+__version__ = "1.0.0"
+__maintainer__ = "Alejandro Sánchez Gómez"
+__email__ = "alejandro@recession-dashboard.com"
+__status__ = "Production"
+
+class KPI_REGISTRY:
+    """Class used to read the catalogue of KPIs from a JSON file and select which of them have to be computed.
+    Each KPI of the catalogue has a "name" (name of its blob), a "series_id" (name used by its API), an "api_class" (name from api.API_CLASSES),
+    an "enabled" flag, and optionally a "target" flag for the KPI predicted by the model (USREC), which is always placed first.
+    """
+    path = os.environ.get("NRR_KPI_REGISTRY", os.path.join(os.path.dirname(__file__), "kpis.json")) # location of the catalogue of KPIs.
+
+    def load(path=None):
+        """Reads the catalogue of KPIs. If it does not have the correct format, it will throw exceptions.
+        path: Optional location of the catalogue. If not given, KPI_REGISTRY.path is used.
+        Returns the list of KPIs, with the target KPI first.
+        """
+        with open(path or KPI_REGISTRY.path) as file:
+            entries = json.load(file)
+
+        names = set() # names already read, as each KPI needs its own blob.
+        for entry in entries:
+            for key in ("name", "series_id", "api_class"): # throws KeyError if a KPI lacks a required key.
+                if key not in entry: raise KeyError(f"Every KPI of the catalogue must have a '{key}'. Found {entry} instead.")
+            if entry["api_class"] not in api.API_CLASSES.__members__: # throws ValueError if the API is not coded.
+                raise ValueError(f"The API of the KPI {entry['name']} must be one of {list(api.API_CLASSES.__members__)}. Found {entry['api_class']} instead.")
+            if entry["name"] in names: # throws ValueError if two KPIs share a name.
+                raise ValueError(f"The KPI {entry['name']} is defined twice in the catalogue.")
+            names.add(entry["name"])
+            entry.setdefault("enabled", True)
+            entry.setdefault("target", False)
+        if sum(entry["target"] for entry in entries) != 1: # throws ValueError if there is not a single target KPI.
+            raise ValueError("The catalogue must contain exactly one target KPI.")
+
+        return sorted(entries, key=lambda entry: not entry["target"]) # places the target KPI first, keeping the order of the rest.
+
+    def get_entries(selection=None, path=None):
+        """Returns the enabled KPIs of the catalogue, with the target KPI first.
+        selection: Optional list of names or series ids of the KPIs to compute. If not given, all enabled KPIs are returned.
+        path: Optional location of the catalogue. If not given, KPI_REGISTRY.path is used.
+        """
+        entries = [entry for entry in KPI_REGISTRY.load(path) if entry["enabled"]]
+        if not selection: return entries
+
+        selected = [entry for entry in entries if entry["name"] in selection or entry["series_id"] in selection]
+        unknown = set(selection) - {entry["name"] for entry in selected} - {entry["series_id"] for entry in selected}
+        if unknown: # throws ValueError if a selected KPI is not enabled in the catalogue.
+            raise ValueError(f"The selected KPIs {sorted(unknown)} are not enabled in the catalogue.")
+        return selected
+
+    def is_complete(entries, path=None):
+        """Returns True if the KPIs are all the enabled KPIs of the catalogue, which are needed to calculate the NRR."""
+        return [entry["name"] for entry in entries] == [entry["name"] for entry in KPI_REGISTRY.get_entries(path=path)]
+
+    def get_api_class(entry):
+        """Returns the value of the API of the KPI in the api.API_CLASSES catalogue."""
+        return api.API_CLASSES[entry["api_class"]].value
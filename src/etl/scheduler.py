@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+"""Provides the necessary methods need to extract the data of several KPIs at the same time.
+- KPI_SCHEDULER: Class used to run the KPIs extraction through a shared thread pool, bounding the number of parallel requests per API.
+"""
+import time # measures how long it takes to extract each KPI.
+import threading # bounds the number of parallel extractions per API.
+from concurrent.futures import ThreadPoolExecutor # provides modules for extracting the KPIs in parallel.
+from etl import api # imports the API module in order to know the catalogue of the coded APIs.
+
+__author__ = "Alejandro Sánchez Gómez"
+__copyright__ = "Copyright 2024, Recession Dashboard"
+__license__ = "MIT license"
+__version__ = "1.0.0"
+__maintainer__ = "Alejandro Sánchez Gómez"
+__email__ = "alejandro@recession-dashboard.com"
+__status__ = "Production"
+
+class KPI_SCHEDULER:
+    """Class used to run the KPIs extraction through a shared thread pool, bounding the number of parallel requests per API."""
+    source_limits = { # default maximum number of KPIs extracted at the same time from each API.
+        api.API_CLASSES.STLOUIS.value: 8, # the FRED API allows several parallel requests per API key.
+        api.API_CLASSES.USTREASURY.value: 1 # the U.S.Treasury timeserie already parallelizes its own yearly requests.
+    }
+
+    def __init__(self, source_limits=None):
+        """Initializes the scheduler.
+        source_limits: Dictionary with the maximum number of parallel extractions for each API of the catalogue.
+        """
+        limits = dict(KPI_SCHEDULER.source_limits) # copies the default limits so they are not modified.
+        if source_limits: limits.update(source_limits) # overrides the default limits with the given ones.
+        self.semaphores = {source: threading.BoundedSemaphore(limit) for source, limit in limits.items()} # one semaphore per API bounds its parallel extractions.
+        self.timings = {} # stores the time spent extracting each KPI.
+
+    def get_timings(self):
+        """Returns the time spent extracting each KPI, in seconds."""
+        return self.timings
+
+    def fetch(self, kpi, api_class, kpi_id):
+        """Sets the KPI dataframe as soon as its API allows another parallel extraction.
+        kpi: KPI object whose data has to be set.
+        api_class: Value of the API from the catalogue that provides the data.
+        kpi_id: Name used by the API to select the desired timeseries data.
+        """
+        with self.semaphores.setdefault(api_class, threading.BoundedSemaphore(1)): # waits until the API allows another parallel extraction.
+            start = time.perf_counter()
+            kpi.set_data(api_class, kpi_id) # extracts and transforms the data of the KPI.
+            self.timings[kpi.get_name()] = time.perf_counter() - start
+        print(f"KPI {kpi.get_name()} ({kpi_id}) set in {self.timings[kpi.get_name()]:.2f}s")
+
+    def run(self, jobs):
+        """Extracts the data of all KPIs at the same time and waits until all of them are set.
+        jobs: List of tuples (kpi, api_class, kpi_id). The order of the list is kept, so KPIs required first (USREC) should be placed first.
+        Returns the time spent extracting each KPI, in seconds.
+        """
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(len(jobs), 1)) as executor: # one thread per KPI, the semaphores bound the parallel requests per API.
+            futures = [executor.submit(self.fetch, *job) for job in jobs] # submits all extractions keeping the order of the list.
+            for future in futures: future.result() # waits for each extraction and raises its exceptions, if any.
+        print(f"All KPIs set in {time.perf_counter() - start:.2f}s")
+
+        return self.timings
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+"""Provides the necessary classes and methods need to load data into our Data Warehouse located at Azure Blob Storage.
+- STORAGE: Class used to share a single Azure Blob Storage client between all uploads and to upload several blobs at the same time.
+- LOCAL_BLOB_SERVICE: Stand-in for the Azure Blob Storage client that stores the blobs into a local directory, used when NRR_STORAGE_DIR is set.
+- LOCAL_BLOB: Stand-in for the Azure Blob Storage blob client used by LOCAL_BLOB_SERVICE.
+- SERIALIZER: Class used to serialize dataframes into the blob formats supported by the Data Warehouse: CSV, Parquet and Arrow IPC.
+- PARTITIONS: Class used to store timeseries dataframes as one blob per year plus a manifest, so only the changed years are written and readers only load the years they need.
+"""
+import os # access Window's system environmental variables in order to authentificate to Azure Blob Storage.
+import io # transforms data into a stream of in-memory bytes.
+import shutil # copies the streams of the local blobs.
+import threading # makes sure the shared client is only created once.
+import json # stores the metadata of the local blobs.
+import hashlib # identifies the content of the blobs by its hash, so unchanged blobs are not uploaded again.
+import pandas as pd # reads the serialized dataframes.
+from etl import metrics # measures the time and bytes of each upload.
+from concurrent.futures import ThreadPoolExecutor # provides modules for making parallel uploads.
+from azure.storage.blob import BlobServiceClient, ExponentialRetry # uploads data in Azure Blob Storage.
+from azure.core.exceptions import ResourceNotFoundError # raised when a blob does not exist yet.
+try: # pyarrow is only needed by the Parquet and Arrow IPC formats.
+    import pyarrow # builds typed tables from dataframes.
+    import pyarrow.parquet # writes tables in Parquet format.
+except ImportError:
+    pyarrow = None
+
+__author__ = "Alejandro Sánchez Gómez"
+__copyright__ = "Copyright 2024, Recession Dashboard"
+__license__ = "MIT license"
+__version__ = "1.0.0"
+__maintainer__ = "Alejandro Sánchez Gómez"
+__email__ = "alejandro@recession-dashboard.com"
+__status__ = "Production"
+
+class LOCAL_BLOB:
+    """Stand-in for the Azure Blob Storage blob client used by LOCAL_BLOB_SERVICE."""
+    def __init__(self, path):
+        """Initializes the blob.
+        path: Path of the file that stores the blob.
+        """
+        self.path = path
+
+    def get_blob_properties(self):
+        """Returns the properties of the blob. Only the metadata, stored next to the blob file, is provided."""
+        if not os.path.exists(self.path): # behaves as Azure Blob Storage if the blob does not exist.
+            raise ResourceNotFoundError(f"The blob {self.path} does not exist.")
+        metadata = {}
+        if os.path.exists(self.path + ".metadata.json"):
+            with open(self.path + ".metadata.json") as file:
+                metadata = json.load(file)
+        return type("BlobProperties", (), {"metadata": metadata})()
+
+    def download_blob(self):
+        """Returns a downloader of the blob, whose readall method returns its bytes."""
+        if not os.path.exists(self.path): # behaves as Azure Blob Storage if the blob does not exist.
+            raise ResourceNotFoundError(f"The blob {self.path} does not exist.")
+        with open(self.path, "rb") as file:
+            content = file.read()
+        return type("StorageStreamDownloader", (), {"readall": lambda self: content})()
+
+    def upload_blob(self, data, overwrite=False, metadata=None, **kwargs):
+        """Stores the data into the file of the blob, and its metadata next to it. Other Azure arguments are ignored."""
+        if not overwrite and os.path.exists(self.path): # behaves as Azure Blob Storage if the blob already exists.
+            raise FileExistsError(f"The blob {self.path} already exists.")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp = self.path + f".{threading.get_ident()}.tmp" # writes to a temporary file first, so a blob is never read half written.
+        with open(temp, "wb") as file:
+            if hasattr(data, "read"): shutil.copyfileobj(data, file) # copies streams by chunks.
+            else: file.write(data)
+        os.replace(temp, self.path)
+        with open(self.path + ".metadata.json", "w") as file:
+            json.dump(metadata or {}, file)
+
+class LOCAL_BLOB_SERVICE:
+    """Stand-in for the Azure Blob Storage client that stores the blobs into a local directory, used when NRR_STORAGE_DIR is set."""
+    def __init__(self, directory):
+        """Initializes the client.
+        directory: Local directory where each container is stored as a subdirectory.
+        """
+        self.directory = directory
+
+    def get_blob_client(self, container, blob):
+        """Returns the client of the blob."""
+        return LOCAL_BLOB(os.path.join(self.directory, container, *blob.split("/")))
+
+class SERIALIZER:
+    """Class used to serialize dataframes into the blob formats supported by the Data Warehouse: CSV, Parquet and Arrow IPC."""
+    format = os.environ.get("NRR_BLOB_FORMAT", "csv") # blob format: "csv", "parquet" or "arrow".
+    compression = os.environ.get("NRR_BLOB_COMPRESSION", "zstd") # compression of the Parquet ("zstd" or "snappy") and Arrow IPC ("zstd" or "lz4") formats.
+    extensions = {"csv": "", "parquet": ".parquet", "arrow": ".arrow"} # suffix added to the blob names of each format.
+
+    def get_schema(df):
+        """Returns the pyarrow schema of the dataframe: datetime columns as timestamps, integer columns as integers and the rest as floats."""
+        fields = []
+        for n, dtype in df.dtypes.items():
+            if dtype.kind == "M": fields.append((n, pyarrow.timestamp("ms")))
+            elif dtype.kind in "iu": fields.append((n, pyarrow.int64()))
+            else: fields.append((n, pyarrow.float64()))
+        return pyarrow.schema(fields)
+
+    def serialize(df, format=None):
+        """Writes the dataframe into an in-memory bytes stream.
+        df: Pandas dataframe to serialize.
+        format: Optional blob format. If not given, SERIALIZER.format is used.
+        Returns the stream, positioned at its start, and the suffix of the blob name.
+        """
+        format = format or SERIALIZER.format
+        if format not in SERIALIZER.extensions: # throws ValueError if the format is not supported.
+            raise ValueError(f"The blob format must be one of {list(SERIALIZER.extensions)}. Found {format} instead.")
+        if format != "csv" and pyarrow is None: # throws ImportError if pyarrow is needed but not installed.
+            raise ImportError(f"The {format} blob format requires the pyarrow package.")
+
+        writer = io.BytesIO() # prepares the bytes streamer.
+        if format == "csv":
+            df.to_csv(writer) # stores the timeserie as CSV through the conversion from pandas dataframe to in-memory bytes.
+        else:
+            schema = SERIALIZER.get_schema(df)
+            table = pyarrow.Table.from_pandas(df, schema=schema, preserve_index=False) # typed table without the pandas index.
+            if format == "parquet":
+                pyarrow.parquet.write_table(table, writer, compression=SERIALIZER.compression)
+            else:
+                compression = SERIALIZER.compression if SERIALIZER.compression in ("zstd", "lz4") else None # Arrow IPC only supports these compressions.
+                with pyarrow.ipc.new_file(writer, schema, options=pyarrow.ipc.IpcWriteOptions(compression=compression)) as ipc_writer:
+                    ipc_writer.write_table(table)
+        writer.seek(0)
+
+        return writer, SERIALIZER.extensions[format]
+
+    def deserialize(content, format=None):
+        """Reads a dataframe written by the serialize method.
+        content: Bytes of the blob.
+        format: Optional blob format. If not given, SERIALIZER.format is used.
+        Returns a pandas dataframe.
+        """
+        format = format or SERIALIZER.format
+        reader = io.BytesIO(content)
+        if format == "csv": return pd.read_csv(reader, index_col=0, parse_dates=["date"])
+        if format == "parquet": return pd.read_parquet(reader)
+        return pyarrow.ipc.open_file(reader).read_pandas()
+
+class STORAGE:
+    """Class used to share a single Azure Blob Storage client between all uploads and to upload several blobs at the same time."""
+    client = None # shared client, created the first time it is used.
+    lock = threading.Lock() # makes sure the shared client is only created once.
+    max_workers = int(os.environ.get("NRR_UPLOAD_WORKERS", 10)) # maximum number of blobs uploaded at the same time.
+    max_concurrency = 4 # maximum number of parallel connections used to upload the chunks of a single large blob.
+    retry_total = 5 # maximum number of retries of a failed request.
+    retry_backoff = 2 # seconds waited before the first retry. Each retry waits longer than the previous one.
+    digest_key = "content_sha256" # name of the blob metadata that stores the hash of its content.
+
+    def get_client():
+        """Returns the shared client. It authentificates into the Data Warehouse the first time it is used,
+        or stores the blobs into the NRR_STORAGE_DIR local directory, if set.
+        """
+        with STORAGE.lock:
+            if STORAGE.client is None:
+                local_dir = os.getenv('NRR_STORAGE_DIR') # local directory used instead of the Data Warehouse, if any.
+                if local_dir:
+                    STORAGE.client = LOCAL_BLOB_SERVICE(local_dir)
+                else:
+                    connect_str = os.getenv('KEY_NRR_DATA') # gets the key needed to authentificate into our Data Warehouse.
+                    retry = ExponentialRetry(initial_backoff=STORAGE.retry_backoff, increment_base=2, retry_total=STORAGE.retry_total) # retries failed requests with growing waits.
+                    STORAGE.client = BlobServiceClient.from_connection_string(connect_str, retry_policy=retry) # authentificates into the Data Warehouse hosted at Azure Blob Storage.
+            return STORAGE.client
+
+    def get_digest(blob_client):
+        """Returns the content hash stored in the metadata of the blob, or None if the blob does not exist or has no hash."""
+        try:
+            return blob_client.get_blob_properties().metadata.get(STORAGE.digest_key)
+        except ResourceNotFoundError:
+            return None
+
+    def get_content_digest(data):
+        """Returns the SHA-256 hash and the length of the bytes, or in-memory bytes stream, without copying it."""
+        if isinstance(data, io.BytesIO):
+            with data.getbuffer() as view: # reads the stream without copying it.
+                return hashlib.sha256(view).hexdigest(), view.nbytes
+        return hashlib.sha256(data).hexdigest(), len(data)
+
+    def download(container, blob):
+        """Returns the bytes of a blob of the Data Warehouse, or None if it does not exist."""
+        try:
+            return STORAGE.get_client().get_blob_client(container = container, blob = blob).download_blob().readall()
+        except ResourceNotFoundError:
+            return None
+
+    def upload(container, blob, data, skip_unchanged=True):
+        """Uploads the data into a blob of the Data Warehouse, overwriting it. If the blob already has the same content, it is skipped.
+        container: Name of the container.
+        blob: Name of the blob.
+        data: Bytes, or in-memory bytes stream, to upload. Streams are uploaded without copying them into bytes.
+        skip_unchanged: If False, the content of the blob is not checked before uploading it.
+        Returns True if the blob was uploaded, False if it was skipped.
+        The upload is measured per container and KPI (the blob name before the first "/"), so the years and manifest of a partitioned KPI are added together.
+        """
+        with metrics.METRICS.stage("upload", f"{container}/{blob.split('/')[0]}") as stage:
+            blob_client = STORAGE.get_client().get_blob_client(container = container, blob = blob)
+            digest, length = STORAGE.get_content_digest(data) # hash of the content to upload.
+            if skip_unchanged and STORAGE.get_digest(blob_client) == digest: # the blob already has the same content.
+                print(f"Blob {container}/{blob} unchanged, upload skipped.")
+                return False
+
+            blob_client.upload_blob(data, length = length, overwrite = True, metadata = {STORAGE.digest_key: digest}, max_concurrency = STORAGE.max_concurrency) # uploads it into the Data Warehouse, splitting large blobs into parallel chunks.
+            stage.add(bytes=length)
+        print(f"Blob {container}/{blob} successfully uploaded!")
+        return True
+
+    def upload_many(uploads):
+        """Uploads several blobs at the same time and waits until all of them are uploaded. Blobs that already have the same content are skipped.
+        uploads: List of tuples (container, blob, data) or (container, blob, data, skip_unchanged).
+        Returns the number of uploaded blobs.
+        """
+        with ThreadPoolExecutor(max_workers=max(min(len(uploads), STORAGE.max_workers), 1)) as executor:
+            futures = [executor.submit(STORAGE.upload, *upload) for upload in uploads]
+            uploaded = sum(future.result() for future in futures) # waits for each upload and raises its exceptions, if any.
+        print(f"{uploaded} blobs uploaded, {len(uploads) - uploaded} unchanged blobs skipped.")
+
+        return uploaded
+
+class PARTITIONS:
+    """Class used to store timeseries dataframes as one blob per year plus a manifest, so only the changed years are written and readers only load the years they need.
+    The blobs are named "<prefix>/year=YYYY/part<extension>" and the manifest "<prefix>/_manifest.json" stores the hash, rows and dates of each year.
+    """
+    def get_manifest(container, prefix):
+        """Returns the stored manifest of the timeseries as a dictionary, or an empty manifest if it has never been stored."""
+        content = STORAGE.download(container, prefix + "/_manifest.json")
+        if content is None: return {"format": None, "partitions": {}}
+        return json.loads(content)
+
+    def get_uploads(container, prefix, df, format=None):
+        """Serializes each year of the timeseries and compares it with the stored manifest.
+        container: Name of the container.
+        prefix: Name of the timeseries, used as prefix of its blobs.
+        df: Pandas dataframe with a "date" column.
+        format: Optional blob format. If not given, SERIALIZER.format is used.
+        Returns the list of uploads of the changed years, and the upload of the new manifest, or None if no year changed.
+        The manifest has to be uploaded after the years, so readers never find a manifest pointing to missing data.
+        """
+        format = format or SERIALIZER.format
+        stored = PARTITIONS.get_manifest(container, prefix)
+        manifest = {"format": format, "partitions": {}}
+        uploads = []
+
+        for year, part in df.groupby(df["date"].dt.year, sort=True): # serializes each year on its own.
+            writer, extension = SERIALIZER.serialize(part.reset_index(drop=True), format) # the index restarts every year, so other years do not change it.
+            digest, _ = STORAGE.get_content_digest(writer)
+            blob = f"{prefix}/year={year}/part{extension}"
+            manifest["partitions"][str(year)] = {"blob": blob, "sha256": digest, "rows": len(part),
+                                                 "start": part["date"].min().strftime("%Y-%m-%d"), "end": part["date"].max().strftime("%Y-%m-%d")}
+            if stored["partitions"].get(str(year)) != manifest["partitions"][str(year)]: # only the changed years are uploaded.
+                uploads.append((container, blob, writer, False))
+
+        if not uploads and stored == manifest: return uploads, None
+        return uploads, (container, prefix + "/_manifest.json", json.dumps(manifest, indent=1).encode(), False)
+
+    def upload(container, prefix, df, format=None):
+        """Uploads the changed years of the timeseries in parallel, then its manifest.
+        Returns the number of uploaded years.
+        """
+        uploads, manifest = PARTITIONS.get_uploads(container, prefix, df, format)
+        uploaded = STORAGE.upload_many(uploads) if uploads else 0
+        if manifest is not None: STORAGE.upload(*manifest)
+        print(f"Timeserie {container}/{prefix}: {uploaded} years uploaded.")
+        return uploaded
+
+    def read(container, prefix, start=None, end=None):
+        """Reads the years of the timeseries between two dates, downloading only the years needed.
+        container: Name of the container.
+        prefix: Name of the timeseries.
+        start: Optional first date. If not given, the timeseries is read from its first date.
+        end: Optional last date. If not given, the timeseries is read until its last date.
+        Returns a pandas dataframe.
+        """
+        manifest = PARTITIONS.get_manifest(container, prefix)
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        blobs = [part["blob"] for _, part in sorted(manifest["partitions"].items()) # years overlapping the dates.
+                 if (start is None or pd.Timestamp(part["end"]) >= start) and (end is None or pd.Timestamp(part["start"]) <= end)]
+
+        with ThreadPoolExecutor(max_workers=max(min(len(blobs), STORAGE.max_workers), 1)) as executor: # downloads the years in parallel.
+            frames = list(executor.map(lambda blob: SERIALIZER.deserialize(STORAGE.download(container, blob), manifest["format"]), blobs))
+        if not frames: return pd.DataFrame()
+
+        df = pd.concat(frames, ignore_index=True) # unites the years into a single dataframe.
+        if start is not None: df = df[df["date"] >= start]
+        if end is not None: df = df[df["date"] <= end]
+        return df.reset_index(drop=True)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+"""Provides the necessary classes and methods need to store the extracted data locally, so it does not have to be extracted again on every run.
+- CACHE_DIR: Local directory where the extracted data is stored. It can be changed through the NRR_CACHE_DIR environmental variable.
+- SERIES_STORE: Class used to store the timeseries data extracted from the FRED repository into a local SQLite database.
+- PAGE_STORE: Class used to store the yearly pages extracted from the U.S. Treasury repository, indexed by year and addressed by the hash of their content.
+- MODEL_STORE: Class used to store the fitted recession risk models and their predictions, keyed by the hash of their training data.
+"""
+import os # access the system environmental variables in order to locate the local storage.
+import time # records when each page was extracted.
+import hashlib # addresses the stored pages by the hash of their content.
+import json # stores the fitted models as text.
+import sqlite3 # stores the extracted data into a local database.
+import threading # names the temporary files after the thread that writes them.
+from contextlib import closing # closes the database connections once they are used.
+import pandas as pd # transforms stored data into workable formats.
+
+__author__ = "Alejandro Sánchez Gómez"
+__copyright__ = "Copyright 2024, Recession Dashboard"
+__license__ = "MIT license"
+__version__ = "1.0.0"
+__maintainer__ = "Alejandro Sánchez Gómez"
+__email__ = "alejandro@recession-dashboard.com"
+__status__ = "Production"
+
+CACHE_DIR = os.environ.get("NRR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "recession-dashboard"))
+
+def open_database(name):
+    """External method created to open a connection to one of the local databases.
+    name: Name of the database file inside CACHE_DIR.
+    Returns a SQLite connection.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True) # creates the local storage directory the first time it is used.
+    connection = sqlite3.connect(os.path.join(CACHE_DIR, name), timeout=30) # waits up to 30 seconds if another thread is writing.
+    connection.execute("PRAGMA journal_mode=WAL") # allows reading while another thread is writing.
+    return connection
+
+class SERIES_STORE:
+    """Class used to store the timeseries data extracted from the FRED repository into a local SQLite database."""
+    database = "series.sqlite" # name of the database file inside CACHE_DIR.
+
+    def connect():
+        """Opens a connection to the database and creates its table the first time it is used.
+        Returns a SQLite connection.
+        """
+        connection = open_database(SERIES_STORE.database)
+        connection.execute("CREATE TABLE IF NOT EXISTS observations (id TEXT NOT NULL, date TEXT NOT NULL, value REAL, PRIMARY KEY (id, date))")
+        return connection
+
+    def get_last_date(id):
+        """Returns the last stored date of the timeseries as a "YYYY-MM-DD" string, or None if the timeseries has never been stored.
+        id: Name of the timeseries data.
+        """
+        with closing(SERIES_STORE.connect()) as connection, connection:
+            row = connection.execute("SELECT MAX(date) FROM observations WHERE id = ?", (id,)).fetchone()
+        return row[0]
+
+    def get_series(id):
+        """Returns the stored timeseries as a pandas dataframe with the columns "date" and "id", sorted by date.
+        id: Name of the timeseries data.
+        """
+        with closing(SERIES_STORE.connect()) as connection, connection:
+            df = pd.read_sql_query("SELECT date, value FROM observations WHERE id = ? ORDER BY date", connection, params=(id,))
+        df["date"] = pd.to_datetime(df["date"]) # converts the datatype of the "date" column to datetime.
+        df["value"] = pd.to_numeric(df["value"], errors = 'coerce') # missing values are stored as NULL.
+        return df.rename(columns={"value": id})
+
+    def set_series(id, df):
+        """Merges the newly extracted observations into the stored timeseries. Stored observations from the first new date onwards are replaced, so revised values overwrite the old ones.
+        id: Name of the timeseries data.
+        df: Pandas dataframe with the columns "date" and "id".
+        """
+        if df is None or df.empty: return # nothing to merge.
+        dates = df["date"].dt.strftime("%Y-%m-%d")
+        values = df[id].astype(float)
+        rows = [(id, date, None if pd.isna(value) else value) for date, value in zip(dates, values)]
+
+        with closing(SERIES_STORE.connect()) as connection, connection: # commits all changes at once, or none of them if it fails.
+            connection.execute("DELETE FROM observations WHERE id = ? AND date >= ?", (id, dates.min())) # removes the observations that have been extracted again.
+            connection.executemany("INSERT INTO observations (id, date, value) VALUES (?, ?, ?)", rows)
+
+class PAGE_STORE:
+    """Class used to store the yearly pages extracted from the U.S. Treasury repository, indexed by year and addressed by the hash of their content.
+    Page contents are stored once as files named after their SHA-256 hash, and a SQLite index maps every (id, year) to its content and HTTP validators.
+    """
+    database = "pages.sqlite" # name of the index database file inside CACHE_DIR.
+    objects = "pages" # name of the directory inside CACHE_DIR where the page contents are stored.
+
+    def connect():
+        """Opens a connection to the index database and creates its table the first time it is used.
+        Returns a SQLite connection.
+        """
+        connection = open_database(PAGE_STORE.database)
+        connection.execute("CREATE TABLE IF NOT EXISTS pages (id TEXT NOT NULL, year INTEGER NOT NULL, digest TEXT NOT NULL, etag TEXT, last_modified TEXT, fetched_at REAL NOT NULL, PRIMARY KEY (id, year))")
+        return connection
+
+    def get_path(digest):
+        """Returns the path of the file that stores the content with the given hash."""
+        return os.path.join(CACHE_DIR, PAGE_STORE.objects, digest[:2], digest + ".xml")
+
+    def get_page(id, year):
+        """Returns the stored page as a dictionary with the keys "content", "digest", "etag", "last_modified" and "fetched_at", or None if it has never been stored.
+        id: Name of the timeseries data.
+        year: Year of the page.
+        """
+        with closing(PAGE_STORE.connect()) as connection, connection:
+            row = connection.execute("SELECT digest, etag, last_modified, fetched_at FROM pages WHERE id = ? AND year = ?", (id, year)).fetchone()
+        if row is None: return None
+        try: # the content file may have been removed by hand.
+            with open(PAGE_STORE.get_path(row[0]), "rb") as file:
+                content = file.read()
+        except OSError:
+            return None
+        return {"content": content, "digest": row[0], "etag": row[1], "last_modified": row[2], "fetched_at": row[3]}
+
+    def set_page(id, year, content, etag=None, last_modified=None):
+        """Stores the extracted page and its HTTP validators.
+        id: Name of the timeseries data.
+        year: Year of the page.
+        content: Bytes of the page.
+        etag: ETag header of the response, if any.
+        last_modified: Last-Modified header of the response, if any.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        path = PAGE_STORE.get_path(digest)
+        if not os.path.exists(path): # the same content is only stored once.
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp = path + f".{os.getpid()}.{threading.get_ident()}.tmp" # writes to a temporary file first, so a page is never read half written. Each thread writes its own file.
+            with open(temp, "wb") as file:
+                file.write(content)
+            os.replace(temp, path)
+        with closing(PAGE_STORE.connect()) as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO pages (id, year, digest, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+                               (id, year, digest, etag, last_modified, time.time()))
+
+    def touch_page(id, year):
+        """Records that the stored page has just been validated against the repository."""
+        with closing(PAGE_STORE.connect()) as connection, connection:
+            connection.execute("UPDATE pages SET fetched_at = ? WHERE id = ? AND year = ?", (time.time(), id, year))
+
+    def list_pages(id=None):
+        """Returns a pandas dataframe with the stored pages, their hash, validators and extraction datetime.
+        id: Optional name of the timeseries data. If not given, the pages of all timeseries are returned.
+        """
+        query = "SELECT id, year, digest, etag, last_modified, fetched_at FROM pages"
+        params = ()
+        if id is not None:
+            query, params = query + " WHERE id = ?", (id,)
+        with closing(PAGE_STORE.connect()) as connection, connection:
+            df = pd.read_sql_query(query + " ORDER BY id, year", connection, params=params)
+        df["fetched_at"] = pd.to_datetime(df["fetched_at"], unit="s") # converts the extraction time to datetime.
+        return df
+
+    def purge(id=None, year=None):
+        """Removes stored pages, so they are extracted again on the next run. Content files no longer used by any page are deleted.
+        id: Optional name of the timeseries data. If not given, the pages of all timeseries are removed.
+        year: Optional year. If not given, the pages of all years are removed.
+        Returns the number of removed pages.
+        """
+        conditions, params = [], []
+        if id is not None: conditions, params = conditions + ["id = ?"], params + [id]
+        if year is not None: conditions, params = conditions + ["year = ?"], params + [year]
+        where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+
+        with closing(PAGE_STORE.connect()) as connection, connection:
+            digests = {row[0] for row in connection.execute("SELECT digest FROM pages" + where, params)} # hashes of the removed pages.
+            removed = connection.execute("DELETE FROM pages" + where, params).rowcount
+            used = {row[0] for row in connection.execute("SELECT digest FROM pages")} # hashes still used by other pages.
+
+        for digest in digests - used: # deletes only the content files of the removed pages, so files being written by other threads are kept.
+            try:
+                os.remove(PAGE_STORE.get_path(digest))
+            except FileNotFoundError:
+                pass # the content file may have been removed by hand.
+        return removed
+
+class MODEL_STORE:
+    """Class used to store the fitted recession risk models and their predictions, keyed by the hash of their training data."""
+    database = "models.sqlite" # name of the database file inside CACHE_DIR.
+
+    def connect():
+        """Opens a connection to the database and creates its tables the first time it is used.
+        Returns a SQLite connection.
+        """
+        connection = open_database(MODEL_STORE.database)
+        connection.execute("CREATE TABLE IF NOT EXISTS models (digest TEXT PRIMARY KEY, created_at REAL NOT NULL, artifact TEXT NOT NULL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS scores (digest TEXT NOT NULL, date TEXT NOT NULL, probability REAL NOT NULL, PRIMARY KEY (digest, date))")
+        return connection
+
+    def get_model(digest):
+        """Returns the stored model as a dictionary, or None if no model has been stored for the training data.
+        digest: Hash of the training data of the model.
+        """
+        with closing(MODEL_STORE.connect()) as connection, connection:
+            row = connection.execute("SELECT artifact FROM models WHERE digest = ?", (digest,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set_model(digest, artifact):
+        """Stores the fitted model and removes the predictions of any previous model with the same training data.
+        digest: Hash of the training data of the model.
+        artifact: Dictionary with the coefficients of the model and the normalization parameters of its KPIs.
+        """
+        with closing(MODEL_STORE.connect()) as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO models (digest, created_at, artifact) VALUES (?, ?, ?)", (digest, time.time(), json.dumps(artifact)))
+            connection.execute("DELETE FROM scores WHERE digest = ?", (digest,))
+
+    def get_scores(digest):
+        """Returns the stored predictions of the model as a pandas dataframe with the columns "date" and "probability", sorted by date.
+        digest: Hash of the training data of the model.
+        """
+        with closing(MODEL_STORE.connect()) as connection, connection:
+            df = pd.read_sql_query("SELECT date, probability FROM scores WHERE digest = ? ORDER BY date", connection, params=(digest,))
+        df["date"] = pd.to_datetime(df["date"]) # converts the datatype of the "date" column to datetime.
+        return df
+
+    def set_scores(digest, df):
+        """Merges the new predictions into the stored ones. Stored predictions from the first new date onwards are replaced.
+        digest: Hash of the training data of the model.
+        df: Pandas dataframe with the columns "date" and "probability".
+        """
+        if df is None or df.empty: return # nothing to merge.
+        dates = pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d")
+        rows = [(digest, date, float(probability)) for date, probability in zip(dates, df["probability"])]
+
+        with closing(MODEL_STORE.connect()) as connection, connection: # commits all changes at once, or none of them if it fails.
+            connection.execute("DELETE FROM scores WHERE digest = ? AND date >= ?", (digest, dates.min()))
+            connection.executemany("INSERT INTO scores (digest, date, probability) VALUES (?, ?, ?)", rows)
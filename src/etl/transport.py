@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+"""Provides the shared HTTP transport used by the API module to extract data from web repositories.
+- RATE_LIMIT: Class used to bound the number of requests per minute sent to a host, as a token bucket.
+- TRANSPORT: Class used to share a single pooled HTTP session between all requests, bounding the parallel requests per host and retrying the failed ones.
+"""
+import os # access the system environmental variables in order to configure the transport.
+import time # waits between retries and refills the rate limits.
+import random # spreads the retries of parallel requests.
+import threading # bounds the parallel requests per host and creates the shared session only once.
+from urllib.parse import urlparse # reads the host of each request.
+from email.utils import parsedate_to_datetime # reads the Retry-After header when it is given as a date.
+import requests # makes HTTP requests to extract data from web repositories.
+
+__author__ = "Alejandro Sánchez Gómez"
+__copyright__ = "Copyright 2024, Recession Dashboard"
+__license__ = "MIT license"
+__version__ = "1.0.0"
+__maintainer__ = "Alejandro Sánchez Gómez"
+__email__ = "alejandro@recession-dashboard.com"
+__status__ = "Production"
+
+class RATE_LIMIT:
+    """Class used to bound the number of requests per minute sent to a host, as a token bucket.
+    Up to "burst" requests are sent at once, and then one more every 60/per_minute seconds.
+    """
+    def __init__(self, per_minute, burst=1):
+        """Initializes the bucket full.
+        per_minute: Maximum number of requests per minute.
+        burst: Maximum number of requests sent at once.
+        """
+        self.rate = per_minute / 60 # tokens added per second.
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0 # no request is sent before this time, as asked by the host with a Retry-After header.
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Waits until a request can be sent to the host, and takes its token."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate) # refills the bucket.
+                self.updated = now
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0)
+                if wait <= 0:
+                    self.tokens = self.tokens - 1
+                    return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stops sending requests to the host for the given seconds."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class TRANSPORT:
+    """Class used to share a single pooled HTTP session between all requests, bounding the parallel requests per host and retrying the failed ones.
+    Connections are kept alive between requests, responses are requested compressed with gzip, and requests that time out, fail to connect or
+    are answered with 429 or 5xx are retried with jittered exponential backoff, honoring the Retry-After header.
+    """
+    session = None # shared session, created the first time it is used.
+    lock = threading.Lock() # makes sure the shared session and the per host limits are only created once.
+    max_per_host = int(os.environ.get("NRR_HTTP_MAX_PER_HOST", 10)) # maximum number of parallel requests sent to a single host.
+    timeout = (10, float(os.environ.get("NRR_HTTP_TIMEOUT", 60))) # seconds waited to connect and to receive data.
+    retry_total = int(os.environ.get("NRR_HTTP_RETRIES", 4)) # maximum number of retries of a failed request.
+    retry_backoff = 1 # seconds waited before the first retry, at most. Each retry waits up to twice as long as the previous one.
+    retry_max = 60 # maximum number of seconds waited before a retry.
+    retry_status = {429, 500, 502, 503, 504} # HTTP status codes of the responses that are retried.
+    rate_limits = { # maximum number of requests per minute and burst of each host.
+        "api.stlouisfed.org": (int(os.environ.get("FRED_RATE_LIMIT", 120)), 10) # the FRED API allows 120 requests per minute per API key.
+    }
+    semaphores = {} # bounds the parallel requests of each host.
+    buckets = {} # rate limit of each host, if any.
+
+    def get_session():
+        """Returns the shared session. It is created the first time it is used, with one pool of kept-alive connections per host."""
+        with TRANSPORT.lock:
+            if TRANSPORT.session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=TRANSPORT.max_per_host) # keeps one open connection per parallel request.
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers["Accept-Encoding"] = "gzip" # responses are downloaded compressed and decompressed by requests.
+                TRANSPORT.session = session
+            return TRANSPORT.session
+
+    def get_limits(host):
+        """Returns the semaphore and the rate limit (None if the host has none) of the host, creating them the first time it is requested."""
+        with TRANSPORT.lock:
+            if host not in TRANSPORT.semaphores:
+                TRANSPORT.semaphores[host] = threading.BoundedSemaphore(TRANSPORT.max_per_host)
+                if host in TRANSPORT.rate_limits: TRANSPORT.buckets[host] = RATE_LIMIT(*TRANSPORT.rate_limits[host])
+            return TRANSPORT.semaphores[host], TRANSPORT.buckets.get(host)
+
+    def get_retry_after(response):
+        """Returns the seconds asked by the Retry-After header of the response, or None if it is not given."""
+        value = response.headers.get("Retry-After") if response is not None else None
+        if not value: return None
+        try: # the header is given either as seconds or as a date.
+            return max(float(value), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                return None
+
+    def get(url, headers=None):
+        """Sends a GET request through the shared session, waiting for the limits of its host, and retries it if it fails.
+        url: URL of the request.
+        headers: Optional dictionary with the headers of the request.
+        Returns the response of the last attempt, whatever its status. Raises a requests.exceptions.RequestException if no response was received.
+        """
+        host = urlparse(url).netloc
+        semaphore, bucket = TRANSPORT.get_limits(host)
+        session = TRANSPORT.get_session()
+
+        for attempt in range(TRANSPORT.retry_total + 1):
+            response, error = None, None
+            with semaphore: # waits until the host allows another parallel request.
+                if bucket is not None: bucket.acquire() # waits until the rate limit of the host allows another request.
+                try:
+                    response = session.get(url, headers=headers, timeout=TRANSPORT.timeout)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    error = e
+            if error is None and response.status_code not in TRANSPORT.retry_status: return response
+            if attempt == TRANSPORT.retry_total: break
+
+            delay = random.uniform(0, min(TRANSPORT.retry_max, TRANSPORT.retry_backoff * 2 ** attempt)) # full jitter, so parallel requests do not retry together.
+            retry_after = TRANSPORT.get_retry_after(response)
+            if retry_after is not None:
+                delay = min(retry_after, TRANSPORT.retry_max)
+                if bucket is not None: bucket.pause(delay) # the other requests to the host wait as well.
+            reason = type(error).__name__ if error is not None else response.status_code # the URL is not printed, as it may contain the API key.
+            print(f"Retrying request to {host} in {delay:.1f}s ({reason}), attempt {attempt + 1}/{TRANSPORT.retry_total}")
+            time.sleep(delay)
+
+        if error is not None: raise error
+        return response
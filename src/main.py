@@ -2,7 +2,8 @@
 
 """Provides coordination between modules and executes them in order to run the system.
 """
-from etl import kpi, nrr # modules used by the program
+import sys # reads the KPIs selected from the command line.
+from etl import kpi, metrics, nrr, registry, scheduler, storage # modules used by the program
 
 __author__ = "Alejandro Sánchez Gómez"
 __copyright__ = "Copyright 2024, Recession Dashboard"
@@ -12,66 +13,58 @@ __maintainer__ = "Alejandro Sánchez Gómez"
 __email__ = "alejandro@recession-dashboard.com"
 __status__ = "Production"
 
-def set_kpi_data(kpi_pce, kpi_cp, kpi_gdp, kpi_indpro, kpi_usrec, kpi_retail, kpi_unrate, kpi_vixcls, kpi_yield):
-        """Defines data for all KPIs that will be used to calculate the NRR."""
-        kpi_pce.set_data(0, "PCE")
-        kpi_cp.set_data(0, "CP")
-        kpi_gdp.set_data(0, "GDP")
-        kpi_indpro.set_data(0, "INDPRO")
-        kpi_usrec.set_data(0, "USREC")
-        kpi_retail.set_data(0, "MRTSSM44000USS")
-        kpi_unrate.set_data(0, "UNRATE")
-        kpi_vixcls.set_data(0, "VIXCLS")
-        kpi_yield.set_data(1, "daily_treasury_yield_curve")     
+def make_kpis(entries):
+        """Creates the KPIs of the catalogue entries."""
+        return [kpi.KPI(entry["name"]) for entry in entries]
+
+def set_kpi_data(entries, list_kpi_items):
+        """Defines data for all KPIs that will be used to calculate the NRR. All KPIs are extracted at the same time.
+        Returns the time spent extracting each KPI, in seconds.
+        """
+        jobs = [(kpi_item, registry.KPI_REGISTRY.get_api_class(entry), entry["series_id"]) for entry, kpi_item in zip(entries, list_kpi_items)] # the target KPI (USREC) goes first.
+        return scheduler.KPI_SCHEDULER().run(jobs) # extracts all KPIs in parallel.
 
 
-def make_list_kpi(kpi_pce, kpi_cp, kpi_gdp, kpi_indpro, kpi_usrec, kpi_retail, kpi_unrate, kpi_vixcls, kpi_yield):
+def make_list_kpi(list_kpi_items):
         """Defines the list of KPIs which will be used to calculate the NRR. 
-        Note: The first item of the list must be kpi_usrec and all parameters must be used.
+        Note: The first item of the list must be the target KPI (USREC), as returned by the catalogue.
         """
-        list_kpi = [] # empty list
-        list_kpi.append(kpi_usrec.get_data()) # append kpi_usrec first
-        list_kpi.append(kpi_pce.get_data())
-        list_kpi.append(kpi_cp.get_data())
-        list_kpi.append(kpi_gdp.get_data())
-        list_kpi.append(kpi_indpro.get_data())
-        list_kpi.append(kpi_retail.get_data())
-        list_kpi.append(kpi_unrate.get_data())
-        list_kpi.append(kpi_vixcls.get_data())
-        list_kpi.append(kpi_yield.get_data())
-
-        return list_kpi
+        return [kpi_item.get_data() for kpi_item in list_kpi_items]
 
-def upload_azure(kpi_pce, kpi_cp, kpi_gdp, kpi_indpro, kpi_usrec, kpi_retail, kpi_unrate, kpi_vixcls, kpi_yield):
-        """Uploads all KPIs data into our Data Warehouse at Azure Blob Storage."""
-        kpi_pce.upload_data_azure()
-        kpi_cp.upload_data_azure()
-        kpi_gdp.upload_data_azure()
-        kpi_indpro.upload_data_azure()
-        kpi_usrec.upload_data_azure()
-        kpi_retail.upload_data_azure()
-        kpi_unrate.upload_data_azure()
-        kpi_vixcls.upload_data_azure()
-        kpi_yield.upload_data_azure()    
+def upload_azure(list_kpi_items, nrr_value=None):
+        """Uploads all KPIs data, and the NRR if given, into our Data Warehouse at Azure Blob Storage. All blobs are uploaded at the same time.
+        With the "partitioned" layout, only the changed years of each KPI are uploaded, and their manifests afterwards.
+        """
+        uploads = [] # blobs to upload.
+        manifests = [] # manifests of the partitioned KPIs, uploaded once their years are uploaded.
+        for kpi_item in list_kpi_items:
+                if kpi.KPI.layout == "partitioned":
+                        parts, manifest = kpi_item.get_partitioned_uploads()
+                        uploads.extend(parts)
+                        if manifest is not None: manifests.append(manifest)
+                else:
+                        uploads.append(kpi_item.get_upload())
+        if nrr_value is not None: uploads.append(nrr_value.get_upload())
+        storage.STORAGE.upload_many(uploads) # uploads all blobs in parallel through the shared client.
+        if manifests: storage.STORAGE.upload_many(manifests)
 
-def run():
-        """Runs the code in order to make the system work."""
-        # sets data for all KPIs
-        kpi_pce = kpi.KPI("pce")
-        kpi_cp = kpi.KPI("cp")
-        kpi_gdp = kpi.KPI("gdp")
-        kpi_indpro = kpi.KPI("indpro")
-        kpi_usrec = kpi.KPI("usrec")
-        kpi_retail = kpi.KPI("retail")
-        kpi_unrate = kpi.KPI("unrate")
-        kpi_vixcls = kpi.KPI("volatility")
-        kpi_yield = kpi.KPI("yield")
+def run(selection=None):
+        """Runs the code in order to make the system work.
+        selection: Optional list of names or series ids of the KPIs to refresh. The NRR is only calculated when all enabled KPIs are selected.
+        """
+        metrics.METRICS.start() # starts measuring the stages of the run.
+        entries = registry.KPI_REGISTRY.get_entries(selection) # KPIs of the catalogue to compute.
+        list_kpi_items = make_kpis(entries)
 
-        set_kpi_data(kpi_pce, kpi_cp, kpi_gdp, kpi_indpro, kpi_usrec, kpi_retail, kpi_unrate, kpi_vixcls, kpi_yield) # sets data into the kpi
-        list_kpi = make_list_kpi(kpi_pce, kpi_cp, kpi_gdp, kpi_indpro, kpi_usrec, kpi_retail, kpi_unrate, kpi_vixcls, kpi_yield) # joins all KPIs into one list
-        nrr_value = nrr.NRR_VALUE(list_kpi) # calculates the NRR
+        set_kpi_data(entries, list_kpi_items) # sets data into the kpi
+        nrr_value = None
+        if registry.KPI_REGISTRY.is_complete(entries):
+                list_kpi = make_list_kpi(list_kpi_items) # joins all KPIs into one list
+                nrr_value = nrr.NRR_VALUE(list_kpi) # calculates the NRR
+        else:
+                print("Partial refresh: the NRR is only calculated when all enabled KPIs are selected.")
 
-        upload_azure(kpi_pce, kpi_cp, kpi_gdp, kpi_indpro, kpi_usrec, kpi_retail, kpi_unrate, kpi_vixcls, kpi_yield) # uploads the KPIs into Azure Blob Storage
-        nrr_value.upload_nrr_azure() # uploads the NRR into Azure Blob Storage
+        upload_azure(list_kpi_items, nrr_value) # uploads the KPIs and the NRR into Azure Blob Storage
+        metrics.METRICS.stop() # exports the metrics of the run, if enabled.
 
-run() # runs the system
\ No newline at end of file
+run(sys.argv[1:]) # runs the system with the KPIs given as arguments, or all enabled KPIs if none are given
\ No newline at end of file